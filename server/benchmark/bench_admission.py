@@ -0,0 +1,83 @@
+"""Send bursts of concurrent /api/converse/v3 requests for one model to a fake Bedrock
+that throttles beyond --quota open streams, and compare how many complete, fail in
+the stream or are turned away with 429 with and without admission control.
+
+    none      no limiter, no retry (BEDROCK_RETRY_ATTEMPTS=1)
+    retry     jittered retry before the first event only
+    admission BEDROCK_MAX_CONCURRENCY=--quota plus retry
+
+    python bench_admission.py --concurrency 32 --quota 8
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+
+from bench_sse_framing import call_app
+from bench_streaming import BENCH_DIR, FAKE_PORT, percentile, server_env, start_process, wait_for_port
+
+sys.path.insert(0, os.path.join(BENCH_DIR, '..', 'src'))
+
+MODES = {
+    'none': {'MAX_CONCURRENCY': 0, 'RETRY_ATTEMPTS': 1},
+    'retry': {'MAX_CONCURRENCY': 0, 'RETRY_ATTEMPTS': 3},
+    'admission': {'MAX_CONCURRENCY': None, 'RETRY_ATTEMPTS': 3},
+}
+
+
+async def run(mode: str, concurrency: int, quota: int, rounds: int) -> dict:
+    import admission
+    import main
+    for name, value in MODES[mode].items():
+        setattr(admission, name, quota if value is None else value)
+    headers = [(b'authorization', b'Bearer bench-key')]
+    body = json.dumps({'messages': [{'role': 'user', 'content': [{'text': 'Hi'}]}],
+                       'modelId': 'us.anthropic.claude-3-7-sonnet-20250219-v1:0',
+                       'region': 'us-west-2'}).encode()
+    results = []
+    for _ in range(rounds):
+        results += await asyncio.gather(*(call_app(main.app, '/api/converse/v3', body, headers)
+                                          for _ in range(concurrency)))
+    completed = [result['elapsed'] for result in results if result['status'] == 200 and not result['error']]
+    return {
+        'mode': mode,
+        'requests': len(results),
+        'completed': len(completed),
+        'stream_errors': sum(1 for result in results if result['status'] == 200 and result['error']),
+        'rejected_429': sum(1 for result in results if result['status'] == 429),
+        'completed_p50_ms': round(percentile(completed, 0.5) * 1000) if completed else None,
+        'completed_p95_ms': round(percentile(completed, 0.95) * 1000) if completed else None,
+    }
+
+
+async def run_all(modes: list, args) -> list:
+    import main
+    report = [await run(mode, args.concurrency, args.quota, args.rounds) for mode in modes]
+    await main.close_http_clients()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--modes', default='none,retry,admission')
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--quota', type=int, default=8)
+    parser.add_argument('--rounds', type=int, default=3)
+    parser.add_argument('--queue', type=int, default=100)
+    args = parser.parse_args()
+    os.environ.update(server_env(0, {'BEDROCK_MAX_QUEUE': str(args.queue)}))
+    fake = start_process([sys.executable, '-m', 'uvicorn', 'fake_upstreams:app', '--port', str(FAKE_PORT),
+                          '--log-level', 'warning'], BENCH_DIR,
+                         {'FAKE_MAX_STREAMS': str(args.quota), 'FAKE_TOKEN_COUNT': '20'})
+    try:
+        wait_for_port(FAKE_PORT)
+        report = asyncio.run(run_all(args.modes.split(','), args))
+    finally:
+        fake.terminate()
+        fake.wait()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""Measure peak memory and event-loop stall per MB of attachment for the previous inline
+base64.b64decode path and attachments.decode_attachments.
+
+    python bench_attachments.py --sizes 1,10,50
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+
+def build_messages(size_mb: int) -> list:
+    payload = base64.b64encode(os.urandom(size_mb * 1024 * 1024)).decode()
+    return [{'role': 'user', 'content': [{'text': 'describe'},
+                                         {'video': {'format': 'mp4', 'source': {'bytes': payload}}}]}]
+
+
+def decode_inline(messages: list):
+    for message in messages:
+        for content in message['content']:
+            if 'video' in content:
+                content['video']['source']['bytes'] = base64.b64decode(content['video']['source']['bytes'])
+
+
+async def measure(variant: str, size_mb: int) -> dict:
+    from attachments import decode_attachments
+    from starlette.concurrency import run_in_threadpool
+
+    # start the worker thread up front so its creation isn't counted as a stall
+    await run_in_threadpool(lambda: None)
+    messages = build_messages(size_mb)
+    max_stall = 0.0
+    running = True
+
+    async def ticker():
+        nonlocal max_stall
+        while running:
+            start = time.perf_counter()
+            await asyncio.sleep(0.001)
+            max_stall = max(max_stall, time.perf_counter() - start - 0.001)
+
+    tick_task = asyncio.create_task(ticker())
+    await asyncio.sleep(0.01)
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    tracemalloc.start()
+    start = time.perf_counter()
+    if variant == 'inline':
+        decode_inline(messages)
+    else:
+        await decode_attachments(messages, max_bytes=sys.maxsize)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    await asyncio.sleep(0.01)
+    running = False
+    await tick_task
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {
+        'variant': variant,
+        'size_mb': size_mb,
+        'decode_ms': round(elapsed * 1000, 2),
+        'max_loop_stall_ms': round(max_stall * 1000, 2),
+        'max_loop_stall_ms_per_mb': round(max_stall * 1000 / size_mb, 3),
+        'peak_alloc_mb_per_mb': round(peak / 1024 / 1024 / size_mb, 3),
+        'peak_rss_growth_mb': round((rss_after - rss_before) / 1024, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', default='1,10,50')
+    parser.add_argument('--run', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.run:
+        variant, size_mb = args.run.split(':')
+        print(json.dumps(asyncio.run(measure(variant, int(size_mb)))))
+        return
+    report = []
+    for size_mb in args.sizes.split(','):
+        for variant in ('inline', 'offloaded'):
+            # a fresh process per run keeps ru_maxrss comparable
+            output = subprocess.check_output([sys.executable, __file__, '--run', f'{variant}:{size_mb}'])
+            report.append(json.loads(output))
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
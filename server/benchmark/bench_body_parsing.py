@@ -0,0 +1,94 @@
+"""Compare parse time and peak memory of converse request bodies between the pydantic
+path (json.loads + ConverseRequest validation, as FastAPI did) and the fast path of
+main.read_converse_request, for bodies carrying one image of each size.
+
+`parse` covers reading the body into a ConverseRequest; `decode` adds decoding the
+attachment as create_bedrock_command does. Memory is the tracemalloc peak above
+the body itself.
+
+    python bench_body_parsing.py --sizes-mb 1,10,50
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+from bench_streaming import BENCH_DIR
+
+sys.path.insert(0, os.path.join(BENCH_DIR, '..', 'src'))
+
+
+class BodyRequest:
+    def __init__(self, body: bytes):
+        self._body = body
+
+    async def body(self) -> bytes:
+        return self._body
+
+
+def build_body(size_mb: int) -> bytes:
+    image = base64.b64encode(os.urandom(size_mb * 1024 * 1024 * 3 // 4)).decode()
+    messages = []
+    for index in range(10):
+        messages.append({'role': 'user', 'content': [{'text': f'question {index} ' * 50}]})
+        messages.append({'role': 'assistant', 'content': [{'text': f'answer {index} ' * 200}]})
+    messages.append({'role': 'user', 'content': [{'text': 'What is in this image?'},
+                                                 {'image': {'format': 'png', 'source': {'bytes': image}}}]})
+    return json.dumps({'messages': messages, 'modelId': 'us.anthropic.claude-3-7-sonnet-20250219-v1:0',
+                       'region': 'us-west-2', 'system': [{'text': 'You are helpful.'}]}).encode()
+
+
+async def parse(main, body: bytes, decode: bool):
+    request = await main.read_converse_request(BodyRequest(body))
+    if decode:
+        await main.decode_attachments(request.messages)
+    return request
+
+
+def measure(loop, main, body: bytes, decode: bool, repeats: int) -> dict:
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        loop.run_until_complete(parse(main, body, decode))
+        timings.append(time.perf_counter() - start)
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    request = loop.run_until_complete(parse(main, body, decode))
+    peak = tracemalloc.get_traced_memory()[1] - baseline
+    tracemalloc.stop()
+    del request
+    return {'ms': round(statistics.median(timings) * 1000, 1), 'peak_mb': round(peak / 1024 / 1024, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes-mb', default='1,10,50')
+    parser.add_argument('--repeats', type=int, default=5)
+    args = parser.parse_args()
+    os.environ['ATTACHMENT_CACHE_MAX_BYTES'] = '0'
+    os.environ.setdefault('API_KEY_NAME', 'bench')
+    import main as server
+    # one loop for every run, so event loop and threadpool teardown stay out of the numbers
+    loop = asyncio.new_event_loop()
+    report = []
+    for size_mb in (int(size) for size in args.sizes_mb.split(',')):
+        body = build_body(size_mb)
+        for mode in ('pydantic', 'fast'):
+            server.FAST_BODY_PARSING = mode == 'fast'
+            report.append({
+                'size_mb': size_mb,
+                'mode': mode,
+                'parse': measure(loop, server, body, False, args.repeats),
+                'parse_and_decode': measure(loop, server, body, True, args.repeats),
+            })
+    loop.close()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
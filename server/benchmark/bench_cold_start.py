@@ -0,0 +1,141 @@
+"""Measure the cold start of the server: the import time of main.py, the time until a
+fresh `python main.py` accepts connections and the latency of its first and second
+/api/converse/v3 requests against the fake Bedrock and SSM of fake_upstreams.py.
+
+`lazy` starts without PREWARM_REGIONS, so boto3, botocore, httpx and the clients are
+built by the first request; `prewarm` builds them before the port opens.
+
+    python bench_cold_start.py --runs 5 --max-import-ms 1500
+
+With --max-import-ms the script exits non-zero when the median import time of main
+exceeds the budget, so it can gate a build.
+"""
+import argparse
+import json
+import os
+import re
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+
+from bench_streaming import API_KEY, BENCH_DIR, FAKE_PORT, SRC_DIR, server_env, start_process, wait_for_port
+
+SERVER_PORT = 8090
+IMPORT_LINE = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)')
+
+
+def measure_import(env: dict) -> dict:
+    """Import main in a fresh interpreter and return the cumulative import time of
+    main and of each top-level module it pulled in, in milliseconds."""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import main'],
+                            cwd=SRC_DIR, env=env, capture_output=True, text=True, check=True)
+    modules = {}
+    for line in result.stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if match and len(match.group(3)) <= 2:
+            modules[match.group(4)] = int(match.group(2)) / 1000
+    return modules
+
+
+def wait_for_server(process: subprocess.Popen, port: int, timeout: float = 30) -> float:
+    start = time.perf_counter()
+    while time.perf_counter() - start < timeout:
+        if process.poll() is not None:
+            raise RuntimeError('server exited during startup')
+        try:
+            # a bare connect, so polling doesn't take CPU from the server it is timing
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return time.perf_counter() - start
+        except OSError:
+            time.sleep(0.01)
+    raise RuntimeError(f'port {port} did not open')
+
+
+def timed_converse(url: str) -> tuple:
+    body = {
+        'messages': [{'role': 'user', 'content': [{'text': 'Hi'}]}],
+        'modelId': 'us.anthropic.claude-3-7-sonnet-20250219-v1:0',
+        'region': 'us-west-2'
+    }
+    start = time.perf_counter()
+    first_byte = None
+    with httpx.stream('POST', url, json=body, headers={'Authorization': f'Bearer {API_KEY}'},
+                      timeout=60) as response:
+        for chunk in response.iter_bytes():
+            if first_byte is None:
+                first_byte = time.perf_counter() - start
+            if chunk.startswith(b'Error'):
+                raise RuntimeError(chunk.decode())
+    return first_byte, time.perf_counter() - start
+
+
+def measure_start(mode: str) -> dict:
+    """Time one fresh server from spawn until it accepts connections, then its first two requests."""
+    extra = {'PREWARM_REGIONS': 'us-west-2'} if mode == 'prewarm' else {}
+    process = start_process([sys.executable, 'main.py'], SRC_DIR, server_env(SERVER_PORT, extra))
+    try:
+        ready = wait_for_server(process, SERVER_PORT)
+        url = f'http://127.0.0.1:{SERVER_PORT}/api/converse/v3'
+        first_ttfb, first_total = timed_converse(url)
+        second_ttfb, _ = timed_converse(url)
+        return {
+            'ready': ready,
+            'first_ttfb': first_ttfb,
+            'first_total': first_total,
+            'second_ttfb': second_ttfb,
+            'ready_plus_first_ttfb': ready + first_ttfb,
+        }
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def median_ms(samples: list, key: str) -> float:
+    return round(statistics.median(sample[key] for sample in samples) * 1000, 1)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--modes', default='lazy,prewarm')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--max-import-ms', type=float, default=0)
+    args = parser.parse_args()
+
+    env = {**os.environ, **server_env(SERVER_PORT, {})}
+    imports = [measure_import(env) for _ in range(args.runs)]
+    top_modules = sorted(imports[0], key=lambda name: -imports[0][name])[:8]
+    report = {
+        'import': {
+            'main_ms': round(statistics.median(sample['main'] for sample in imports), 1),
+            'top_modules_ms': {name: round(statistics.median(sample.get(name, 0) for sample in imports), 1)
+                               for name in top_modules if name != 'main'},
+        },
+        'start': []
+    }
+
+    fake = start_process([sys.executable, '-m', 'uvicorn', 'fake_upstreams:app',
+                          '--port', str(FAKE_PORT), '--log-level', 'warning'], BENCH_DIR,
+                         {'FAKE_FIRST_TOKEN_MS': '0', 'FAKE_TOKEN_COUNT': '5', 'FAKE_TOKEN_INTERVAL_MS': '0'})
+    try:
+        wait_for_port(FAKE_PORT)
+        for mode in args.modes.split(','):
+            samples = [measure_start(mode) for _ in range(args.runs)]
+            report['start'].append({
+                'mode': mode,
+                'runs': args.runs,
+                **{f'{key}_ms': median_ms(samples, key) for key in samples[0]}
+            })
+    finally:
+        fake.terminate()
+        fake.wait()
+    print(json.dumps(report, indent=2))
+    if args.max_import_ms and report['import']['main_ms'] > args.max_import_ms:
+        sys.exit(f"import of main took {report['import']['main_ms']}ms, budget {args.max_import_ms}ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""Compare bytes on the wire and server time of /api/converse/v3 request bodies sent
+plain, gzip and zstd encoded, and of /api/image responses as base64 JSON and as raw
+bytes (Accept: image/png), calling the app in-process against the fake upstreams.
+
+The converse body carries --turns text turns and one image of --image-kb of noise,
+which compresses like real image data; the fake image model returns an image of
+--image-kb as well.
+
+    python bench_compression.py --image-kb 1024
+"""
+import argparse
+import asyncio
+import base64
+import gzip
+import json
+import os
+import statistics
+import sys
+import time
+
+from bench_sse_framing import call_app
+from bench_streaming import BENCH_DIR, FAKE_PORT, server_env, start_process, wait_for_port
+
+sys.path.insert(0, os.path.join(BENCH_DIR, '..', 'src'))
+
+AUTHORIZATION = (b'authorization', b'Bearer bench-key')
+
+
+def build_converse_body(turns: int, image_kb: int) -> bytes:
+    messages = []
+    for index in range(turns):
+        messages.append({'role': 'user', 'content': [{'text': f'Question {index}: how does this work? ' * 20}]})
+        messages.append({'role': 'assistant', 'content': [{'text': f'Answer {index}: it works like this. ' * 80}]})
+    image = base64.b64encode(os.urandom(image_kb * 1024)).decode()
+    messages.append({'role': 'user', 'content': [{'text': 'What is in this image?'},
+                                                 {'image': {'format': 'png', 'source': {'bytes': image}}}]})
+    return json.dumps({'messages': messages, 'modelId': 'us.anthropic.claude-3-7-sonnet-20250219-v1:0',
+                       'region': 'us-west-2'}).encode()
+
+
+def encode(body: bytes, encoding: str) -> tuple:
+    start = time.perf_counter()
+    if encoding == 'gzip':
+        body = gzip.compress(body, compresslevel=6)
+    elif encoding == 'zstd':
+        import zstandard
+        body = zstandard.ZstdCompressor(level=3).compress(body)
+    return body, time.perf_counter() - start
+
+
+async def time_calls(app, path: str, body: bytes, headers: list, repeats: int) -> tuple:
+    timings = []
+    for _ in range(repeats):
+        result = await call_app(app, path, body, headers)
+        assert result['status'] == 200 and not result['error'], result
+        timings.append(result['elapsed'])
+    return result, statistics.median(timings)
+
+
+async def run(args) -> dict:
+    import main
+    converse = []
+    body = build_converse_body(args.turns, args.image_kb)
+    for encoding in ('identity', 'gzip', 'zstd'):
+        encoded, encode_time = encode(body, encoding)
+        headers = [AUTHORIZATION] + ([(b'content-encoding', encoding.encode())] if encoding != 'identity' else [])
+        _, elapsed = await time_calls(main.app, '/api/converse/v3', encoded, headers, args.repeats)
+        converse.append({'encoding': encoding, 'request_kb': round(len(encoded) / 1024),
+                         'client_encode_ms': round(encode_time * 1000, 1), 'server_ms': round(elapsed * 1000, 1)})
+    image = []
+    image_body = json.dumps({'prompt': 'a cat', 'modelId': 'amazon.nova-canvas-v1:0', 'region': 'us-west-2',
+                             'width': 1024, 'height': 1024}).encode()
+    for mode, accept in (('json', b'application/json'), ('binary', b'image/png')):
+        result, elapsed = await time_calls(main.app, '/api/image', image_body,
+                                           [AUTHORIZATION, (b'accept', accept)], args.repeats)
+        image.append({'mode': mode, 'response_kb': round(result['bytes'] / 1024),
+                      'server_ms': round(elapsed * 1000, 1)})
+    await main.close_http_clients()
+    return {'converse_v3': converse, 'image': image}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--turns', type=int, default=20)
+    parser.add_argument('--image-kb', type=int, default=1024)
+    parser.add_argument('--repeats', type=int, default=5)
+    args = parser.parse_args()
+    os.environ.update(server_env(0, {'ATTACHMENT_CACHE_MAX_BYTES': '0'}))
+    fake = start_process([sys.executable, '-m', 'uvicorn', 'fake_upstreams:app', '--port', str(FAKE_PORT),
+                          '--log-level', 'warning'], BENCH_DIR,
+                         {'FAKE_FIRST_TOKEN_MS': '0', 'FAKE_TOKEN_COUNT': '1', 'FAKE_TOKEN_INTERVAL_MS': '0',
+                          'FAKE_IMAGE_MS': '0', 'FAKE_IMAGE_KB': str(args.image_kb)})
+    try:
+        wait_for_port(FAKE_PORT)
+        report = asyncio.run(run(args))
+    finally:
+        fake.terminate()
+        fake.wait()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
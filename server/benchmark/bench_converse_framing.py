@@ -0,0 +1,65 @@
+"""Measure writes per response and server CPU per output token of /api/converse/v3 for
+several CONVERSE_COALESCE_WINDOW_MS values, streaming from the fake Bedrock of
+fake_upstreams.py.
+
+    python bench_converse_framing.py --windows 0,10,20 --responses 20
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+from bench_sse_framing import call_app
+from bench_streaming import BENCH_DIR, FAKE_PORT, server_env, start_process, wait_for_port
+
+sys.path.insert(0, os.path.join(BENCH_DIR, '..', 'src'))
+
+
+async def run(window: str, responses: int) -> dict:
+    import bedrock_stream
+    import main
+    bedrock_stream.CONVERSE_COALESCE_WINDOW = float(window) / 1000
+
+    body = json.dumps({'messages': [{'role': 'user', 'content': [{'text': 'Hi'}]}],
+                       'modelId': 'us.anthropic.claude-3-7-sonnet-20250219-v1:0',
+                       'region': 'us-west-2'}).encode()
+    headers = [(b'authorization', b'Bearer bench-key')]
+    cpu_start = time.process_time()
+    results = await asyncio.gather(*(call_app(main.app, '/api/converse/v3', body, headers)
+                                     for _ in range(responses)))
+    cpu = time.process_time() - cpu_start
+    await main.close_http_clients()
+    writes = sum(result['writes'] for result in results)
+    total_bytes = sum(result['bytes'] for result in results)
+    output_tokens = responses * int(os.environ.get('FAKE_TOKEN_COUNT', '200'))
+    return {
+        'window_ms': window,
+        'json_encoder': 'orjson' if bedrock_stream.orjson is not None else 'json',
+        'responses': responses,
+        'writes_per_response': round(writes / responses, 1),
+        'bytes_per_write': round(total_bytes / writes, 1),
+        'cpu_us_per_output_token': round(cpu / output_tokens * 1e6, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--windows', default='0,10,20')
+    parser.add_argument('--responses', type=int, default=20)
+    args = parser.parse_args()
+    os.environ.update(server_env(0, {}))
+    fake = start_process([sys.executable, '-m', 'uvicorn', 'fake_upstreams:app',
+                          '--port', str(FAKE_PORT), '--log-level', 'warning'], BENCH_DIR, {})
+    try:
+        wait_for_port(FAKE_PORT)
+        report = [asyncio.run(run(window, args.responses)) for window in args.windows.split(',')]
+    finally:
+        fake.terminate()
+        fake.wait()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
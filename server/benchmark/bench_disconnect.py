@@ -0,0 +1,99 @@
+"""Measure how quickly upstream streams are closed when clients disconnect mid-answer.
+
+Starts the fake upstream with long answers and `python main.py`, opens --streams
+streams per scenario, drops every connection after its first body chunk and then
+watches the fake upstream: how long its streams stay open, how many deltas it sent
+compared to full answers, and the server's threadpool and abandoned-stream metrics.
+
+    converse_v3       /api/converse/v3 with BEDROCK_STREAM_MODE=async
+    converse_v3_sync  /api/converse/v3 with BEDROCK_STREAM_MODE=sync
+    openai            /api/openai through the fake OpenAI endpoint
+
+    python bench_disconnect.py --streams 20
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+
+import httpx
+
+from bench_streaming import API_KEY, BENCH_DIR, FAKE_PORT, SRC_DIR, server_env, start_process, wait_for_port
+from load_test import build_request
+
+SERVER_PORT = 8097
+TOKEN_COUNT = 500
+SCENARIOS = {
+    'converse_v3': ('converse_v3', {'BEDROCK_STREAM_MODE': 'async'}),
+    'converse_v3_sync': ('converse_v3', {'BEDROCK_STREAM_MODE': 'sync'}),
+    'openai': ('openai', {}),
+}
+
+
+def read_metric(text: str, name: str) -> float:
+    return sum(float(line.rsplit(' ', 1)[1]) for line in text.splitlines()
+               if line.startswith(name + '{') or line.startswith(name + ' '))
+
+
+async def drop_after_first_chunk(client: httpx.AsyncClient, request: dict):
+    async with client.stream('POST', request['url'], json=request['json'], headers=request['headers']) as response:
+        async for _ in response.aiter_raw():
+            break
+
+
+async def run(scenario: str, streams: int, settle: float) -> dict:
+    request = build_request(SCENARIOS[scenario][0])
+    async with httpx.AsyncClient(base_url=f'http://127.0.0.1:{SERVER_PORT}', timeout=60) as client, \
+            httpx.AsyncClient(base_url=f'http://127.0.0.1:{FAKE_PORT}') as fake:
+        before = (await fake.get('/fake/stats')).json()
+        await asyncio.gather(*(drop_after_first_chunk(client, request) for _ in range(streams)))
+        dropped = time.perf_counter()
+        closed_after = None
+        while time.perf_counter() - dropped < settle:
+            stats = (await fake.get('/fake/stats')).json()
+            if closed_after is None and stats['open_streams'] == 0:
+                closed_after = time.perf_counter() - dropped
+            await asyncio.sleep(0.05)
+        metrics = (await client.get('/metrics', headers={'Authorization': f'Bearer {API_KEY}'})).text
+    return {
+        'scenario': scenario,
+        'streams': streams,
+        'upstream_open_after_settle': stats['open_streams'],
+        'upstream_closed_after_s': round(closed_after, 2) if closed_after is not None else None,
+        'upstream_deltas_sent': stats['sent_tokens'] - before['sent_tokens'],
+        'upstream_deltas_full_answers': streams * TOKEN_COUNT,
+        'abandoned_streams_metric': read_metric(metrics, 'swiftchat_abandoned_streams_total'),
+        'threadpool_busy_threads': read_metric(metrics, 'swiftchat_threadpool_busy_threads'),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS))
+    parser.add_argument('--streams', type=int, default=20)
+    parser.add_argument('--settle', type=float, default=3)
+    args = parser.parse_args()
+    fake = start_process([sys.executable, '-m', 'uvicorn', 'fake_upstreams:app', '--port', str(FAKE_PORT),
+                          '--log-level', 'warning'], BENCH_DIR,
+                         {'FAKE_TOKEN_COUNT': str(TOKEN_COUNT), 'FAKE_TOKEN_INTERVAL_MS': '20'})
+    report = []
+    try:
+        wait_for_port(FAKE_PORT)
+        for scenario in args.scenarios.split(','):
+            server = start_process([sys.executable, 'main.py'], SRC_DIR,
+                                   server_env(SERVER_PORT, SCENARIOS[scenario][1]))
+            try:
+                wait_for_port(SERVER_PORT)
+                report.append(asyncio.run(run(scenario, args.streams, args.settle)))
+            finally:
+                server.terminate()
+                server.wait()
+    finally:
+        fake.terminate()
+        fake.wait()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
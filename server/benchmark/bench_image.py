@@ -0,0 +1,88 @@
+"""Measure end-to-end latency and event-loop blocking of concurrent /api/image requests
+against the fake Bedrock of fake_upstreams.py.
+
+`inline` runs the translation and image calls on the event loop as the handler
+used to; `offloaded` is the current handler.
+
+    python bench_image.py --requests 8
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+from bench_sse_framing import call_app
+from bench_streaming import BENCH_DIR, FAKE_PORT, server_env, start_process, wait_for_port
+
+sys.path.insert(0, os.path.join(BENCH_DIR, '..', 'src'))
+
+
+async def run_inline(func, *args):
+    return func(*args)
+
+
+async def run(mode: str, requests: int) -> dict:
+    import main
+    from starlette.concurrency import run_in_threadpool
+    main.run_in_threadpool = run_inline if mode == 'inline' else run_in_threadpool
+
+    body = json.dumps({'prompt': '雪地里的一只猫', 'modelId': 'amazon.nova-canvas-v1:0',
+                       'region': 'us-west-2', 'width': 1024, 'height': 1024}).encode()
+    headers = [(b'authorization', b'Bearer bench-key')]
+    max_stall = 0.0
+    blocked = 0.0
+    running = True
+
+    async def ticker():
+        nonlocal max_stall, blocked
+        while running:
+            start = time.perf_counter()
+            await asyncio.sleep(0.005)
+            stall = time.perf_counter() - start - 0.005
+            max_stall = max(max_stall, stall)
+            if stall > 0.05:
+                blocked += stall
+
+    async def timed_call():
+        start = time.perf_counter()
+        await call_app(main.app, '/api/image', body, headers)
+        return time.perf_counter() - start
+
+    tick_task = asyncio.create_task(ticker())
+    start = time.perf_counter()
+    latencies = sorted(await asyncio.gather(*(timed_call() for _ in range(requests))))
+    wall = time.perf_counter() - start
+    running = False
+    await tick_task
+    return {
+        'mode': mode,
+        'requests': requests,
+        'wall_seconds': round(wall, 2),
+        'latency_p50_s': round(latencies[len(latencies) // 2], 2),
+        'latency_max_s': round(latencies[-1], 2),
+        'max_loop_stall_ms': round(max_stall * 1000, 1),
+        'loop_blocked_ms_per_image': round(blocked * 1000 / requests, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--modes', default='inline,offloaded')
+    parser.add_argument('--requests', type=int, default=8)
+    args = parser.parse_args()
+    os.environ.update(server_env(0, {}))
+    fake = start_process([sys.executable, '-m', 'uvicorn', 'fake_upstreams:app',
+                          '--port', str(FAKE_PORT), '--log-level', 'warning'], BENCH_DIR, {})
+    try:
+        wait_for_port(FAKE_PORT)
+        report = [asyncio.run(run(mode, args.requests)) for mode in args.modes.split(',')]
+    finally:
+        fake.terminate()
+        fake.wait()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""Compare generating N image variants as N concurrent /api/image requests with one
+batch request (count=N), calling the app in-process against the fake upstreams of
+fake_upstreams.py.
+
+Each request uses one reference image, so every single request runs its own
+nova-lite task analysis while the batch runs it once. Reported are the time to
+the first image, the time to all images and the analysis (converse) bytes sent
+to Bedrock.
+
+    python bench_image_batch.py --images 4 --image-ms 3000 --converse-ms 1500
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import sys
+
+import httpx
+
+from bench_sse_framing import call_app
+from bench_streaming import BENCH_DIR, FAKE_PORT, server_env, start_process, wait_for_port
+
+sys.path.insert(0, os.path.join(BENCH_DIR, '..', 'src'))
+
+AUTHORIZATION = (b'authorization', b'Bearer bench-key')
+PHOTO = base64.b64encode(b'\xff\xd8' + os.urandom(256 * 1024)).decode()
+
+
+def build_body(**fields) -> bytes:
+    return json.dumps({'prompt': 'make a variation of this', 'modelId': 'amazon.nova-canvas-v1:0',
+                       'region': 'us-west-2', 'width': 1024, 'height': 1024,
+                       'refImages': [{'source': {'bytes': PHOTO}}], **fields}).encode()
+
+
+async def run_separate(main, images: int) -> dict:
+    results = await asyncio.gather(*(call_app(main.app, '/api/image', build_body(), [AUTHORIZATION])
+                                     for _ in range(images)))
+    assert all(result['status'] == 200 and not result['error'] for result in results), results
+    return {'first_image_ms': round(min(result['elapsed'] for result in results) * 1000),
+            'all_images_ms': round(max(result['elapsed'] for result in results) * 1000)}
+
+
+async def run_batch(main, images: int) -> dict:
+    result = await call_app(main.app, '/api/image', build_body(count=images), [AUTHORIZATION])
+    assert result['status'] == 200 and result['writes'] == images, result
+    return {'first_image_ms': round(result['first_write'] * 1000),
+            'all_images_ms': round(result['elapsed'] * 1000)}
+
+
+async def run_all(args) -> list:
+    import main
+    report = []
+    async with httpx.AsyncClient(base_url=f'http://127.0.0.1:{FAKE_PORT}') as fake:
+        for mode, run in (('separate', run_separate), ('batch', run_batch)):
+            before = (await fake.get('/fake/stats')).json()['received_bytes']
+            timings = await run(main, args.images)
+            after = (await fake.get('/fake/stats')).json()['received_bytes']
+            report.append({'mode': mode, 'images': args.images, **timings,
+                           'analysis_kb': round((after['converse'] - before['converse']) / 1024)})
+    await main.close_http_clients()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--images', type=int, default=4)
+    parser.add_argument('--image-ms', type=int, default=3000)
+    parser.add_argument('--converse-ms', type=int, default=1500)
+    args = parser.parse_args()
+    os.environ.update(server_env(0, {'ANALYSIS_CACHE_MAX_ENTRIES': '0', 'IMAGE_RESIZE': 'false',
+                                     'IMAGE_BATCH_MAX_IMAGES': str(args.images),
+                                     'IMAGE_BATCH_CONCURRENCY': str(args.images)}))
+    fake = start_process([sys.executable, '-m', 'uvicorn', 'fake_upstreams:app', '--port', str(FAKE_PORT),
+                          '--log-level', 'warning'], BENCH_DIR,
+                         {'FAKE_IMAGE_MS': str(args.image_ms), 'FAKE_CONVERSE_MS': str(args.converse_ms)})
+    try:
+        wait_for_port(FAKE_PORT)
+        report = asyncio.run(run_all(args))
+    finally:
+        fake.terminate()
+        fake.wait()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""Compare the bytes sent to Bedrock and the server time of /api/image requests with
+phone-sized reference images, with IMAGE_RESIZE off and on, calling the app
+in-process against the fake upstreams of fake_upstreams.py.
+
+    variation     nova-canvas with one reference image (task analysis + IMAGE_VARIATION)
+    try_on        nova-canvas virtual try-on (garment classification + VIRTUAL_TRY_ON)
+    stability     stability image-to-image
+
+Each scenario runs --repeats times with the same images, so later runs of the
+"on" mode are served from the resize cache.
+
+    python bench_image_resize.py --megapixels 12
+"""
+import argparse
+import asyncio
+import base64
+import io
+import json
+import os
+import statistics
+import sys
+
+import httpx
+
+from bench_sse_framing import call_app
+from bench_streaming import BENCH_DIR, FAKE_PORT, server_env, start_process, wait_for_port
+
+sys.path.insert(0, os.path.join(BENCH_DIR, '..', 'src'))
+
+AUTHORIZATION = (b'authorization', b'Bearer bench-key')
+SCENARIOS = {
+    'variation': ('amazon.nova-canvas-v1:0', 1),
+    'try_on': ('amazon.nova-canvas-v1:0', 2),
+    'stability': ('stability.sd3-5-large-v1:0', 1),
+}
+
+
+def build_photo(megapixels: float, seed: int) -> str:
+    from PIL import Image
+    width = int((megapixels * 1e6 * 4 / 3) ** 0.5)
+    image = Image.effect_noise((width, width * 3 // 4), 30 + seed).convert('RGB')
+    output = io.BytesIO()
+    image.save(output, format='JPEG', quality=92)
+    return base64.b64encode(output.getvalue()).decode()
+
+
+async def run(mode: str, photos: list, repeats: int) -> list:
+    import image_resize
+    import main
+    image_resize.IMAGE_RESIZE = mode == 'on'
+    image_resize.resized_cache.clear()
+    report = []
+    async with httpx.AsyncClient(base_url=f'http://127.0.0.1:{FAKE_PORT}') as fake:
+        for scenario, (model_id, count) in SCENARIOS.items():
+            body = json.dumps({'prompt': 'make a variation of this', 'modelId': model_id, 'region': 'us-west-2',
+                               'width': 1024, 'height': 1024,
+                               'refImages': [{'source': {'bytes': photo}} for photo in photos[:count]]}).encode()
+            before = (await fake.get('/fake/stats')).json()['received_bytes']
+            timings = []
+            for _ in range(repeats):
+                result = await call_app(main.app, '/api/image', body, [AUTHORIZATION])
+                assert result['status'] == 200, result
+                timings.append(result['elapsed'])
+            after = (await fake.get('/fake/stats')).json()['received_bytes']
+            report.append({
+                'mode': mode,
+                'scenario': scenario,
+                'request_kb': round(len(body) / 1024),
+                'bedrock_kb_per_request': {name: round((after[name] - before[name]) / repeats / 1024)
+                                           for name in after},
+                'first_ms': round(timings[0] * 1000),
+                'median_ms': round(statistics.median(timings) * 1000),
+            })
+    return report
+
+
+async def run_all(args) -> list:
+    import main
+    photos = [build_photo(args.megapixels, seed) for seed in range(2)]
+    report = []
+    for mode in ('off', 'on'):
+        report += await run(mode, photos, args.repeats)
+    await main.close_http_clients()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--megapixels', type=float, default=12)
+    parser.add_argument('--repeats', type=int, default=5)
+    args = parser.parse_args()
+    os.environ.update(server_env(0, {'ANALYSIS_CACHE_MAX_ENTRIES': '0'}))
+    fake = start_process([sys.executable, '-m', 'uvicorn', 'fake_upstreams:app', '--port', str(FAKE_PORT),
+                          '--log-level', 'warning'], BENCH_DIR, {'FAKE_IMAGE_MS': '0', 'FAKE_CONVERSE_MS': '0'})
+    try:
+        wait_for_port(FAKE_PORT)
+        report = asyncio.run(run_all(args))
+    finally:
+        fake.terminate()
+        fake.wait()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""Compare time to first byte and input tokens of a growing /api/converse/v3 conversation
+with and without PROMPT_CACHE, against the fake Bedrock of fake_upstreams.py, which
+delays the first delta by --prefill-ms per 1000 uncached input tokens and reports
+cache reads and writes like Bedrock.
+
+The system prompt is --system-kb; every turn adds a user message of --turn-kb and
+an assistant reply of twice that.
+
+    python bench_prompt_cache.py --turns 20
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+
+from bench_sse_framing import call_app
+from bench_streaming import BENCH_DIR, FAKE_PORT, server_env, start_process, wait_for_port
+
+sys.path.insert(0, os.path.join(BENCH_DIR, '..', 'src'))
+
+MODEL_ID = 'us.anthropic.claude-3-7-sonnet-20250219-v1:0'
+
+
+def read_tokens(metrics) -> dict:
+    return {kind: value for (endpoint, _, _, kind), value in metrics.tokens.series.items() if endpoint == 'converse_v3'}
+
+
+async def run(mode: str, turns: int, turn_kb: int, system_kb: int) -> dict:
+    import main
+    import metrics
+    import prompt_cache
+    prompt_cache.PROMPT_CACHE = mode == 'cache'
+    metrics.tokens.series.clear()
+    headers = [(b'authorization', b'Bearer bench-key')]
+    # a distinct system prompt per mode, so the fake's cache starts empty
+    system = [{'text': f'{mode} system prompt ' + 's' * system_kb * 1024}]
+    history = []
+    samples = {}
+    total_ttfb = 0
+    for index in range(turns):
+        history.append({'role': 'user', 'content': [{'text': f'question {index} ' + 'q' * turn_kb * 1024}]})
+        body = json.dumps({'modelId': MODEL_ID, 'region': 'us-west-2', 'system': system,
+                           'messages': history}).encode()
+        result = await call_app(main.app, '/api/converse/v3', body, headers)
+        total_ttfb += result['first_write']
+        if index + 1 in (1, 2, turns // 2, turns):
+            samples[index + 1] = round(result['first_write'] * 1000)
+        history.append({'role': 'assistant', 'content': [{'text': f'answer {index} ' + 'a' * turn_kb * 2048}]})
+    await main.close_http_clients()
+    return {'mode': mode, 'ttfb_ms_by_turn': samples, 'mean_ttfb_ms': round(total_ttfb / turns * 1000),
+            'tokens': read_tokens(metrics)}
+
+
+async def run_all(modes: list, args) -> list:
+    import main
+    # the first request also loads the API key and opens the upstream connection
+    warmup = {'modelId': MODEL_ID, 'region': 'us-west-2', 'messages': [{'role': 'user', 'content': [{'text': 'Hi'}]}]}
+    await call_app(main.app, '/api/converse/v3', json.dumps(warmup).encode(), [(b'authorization', b'Bearer bench-key')])
+    return [await run(mode, args.turns, args.turn_kb, args.system_kb) for mode in modes]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--modes', default='off,cache')
+    parser.add_argument('--turns', type=int, default=20)
+    parser.add_argument('--turn-kb', type=int, default=2)
+    parser.add_argument('--system-kb', type=int, default=16)
+    parser.add_argument('--prefill-ms', default='100')
+    args = parser.parse_args()
+    os.environ.update(server_env(0, {}))
+    fake = start_process([sys.executable, '-m', 'uvicorn', 'fake_upstreams:app', '--port', str(FAKE_PORT),
+                          '--log-level', 'warning'], BENCH_DIR,
+                         {'FAKE_FIRST_TOKEN_MS': '0', 'FAKE_TOKEN_COUNT': '1', 'FAKE_TOKEN_INTERVAL_MS': '0',
+                          'FAKE_PREFILL_MS_PER_1K': args.prefill_ms})
+    try:
+        wait_for_port(FAKE_PORT)
+        report = asyncio.run(run_all(args.modes.split(','), args))
+    finally:
+        fake.terminate()
+        fake.wait()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""Compare the per-turn request size and time to first byte of /api/converse/v3 for a
+growing conversation sent as full history and as session deltas, against the fake
+Bedrock of fake_upstreams.py.
+
+The first user turn carries an image of --image-kb; every turn adds a user message
+and an assistant reply of about --turn-kb each.
+
+    python bench_sessions.py --turns 40
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import sys
+import time
+
+from bench_sse_framing import call_app
+from bench_streaming import BENCH_DIR, FAKE_PORT, server_env, start_process, wait_for_port
+
+sys.path.insert(0, os.path.join(BENCH_DIR, '..', 'src'))
+
+REPEATS = 5
+
+
+def build_turn(index: int, turn_kb: int, image: str | None) -> tuple:
+    user = {'role': 'user', 'content': [{'text': f'question {index} ' + 'q' * turn_kb * 1024}]}
+    if image is not None:
+        user['content'].append({'image': {'format': 'png', 'source': {'bytes': image}}})
+    assistant = {'role': 'assistant', 'content': [{'text': f'answer {index} ' + 'a' * turn_kb * 1024}]}
+    return user, assistant
+
+
+async def run(mode: str, turns: int, turn_kb: int, image_kb: int) -> dict:
+    import main
+    headers = [(b'authorization', b'Bearer bench-key')]
+    image = base64.b64encode(os.urandom(image_kb * 1024)).decode()
+    history = []
+    samples = {}
+    digests = {}
+    for index in range(turns):
+        user, assistant = build_turn(index, turn_kb, image if index == 0 else None)
+        base_length = max(0, len(history) - 1)
+        history.append(user)
+        request = {'modelId': 'us.anthropic.claude-3-7-sonnet-20250219-v1:0', 'region': 'us-west-2'}
+        if mode == 'session':
+            # the previous assistant reply and the new user turn
+            request.update(sessionId='bench', baseLength=base_length, baseDigest=digests.get(base_length),
+                           messages=history[base_length:])
+        else:
+            request['messages'] = history
+        body = json.dumps(request).encode()
+        timings = []
+        for _ in range(REPEATS):
+            start = time.perf_counter()
+            result = await call_app(main.app, '/api/converse/v3', body, headers)
+            timings.append(result['first_write'] if result['first_write'] is not None else time.perf_counter() - start)
+            assert result['status'] == 200, result
+        if mode == 'session':
+            digests[int(result['headers']['x-session-length'])] = result['headers']['x-session-digest']
+        if index + 1 in (1, turns // 4, turns // 2, turns):
+            samples[index + 1] = {'request_kb': round(len(body) / 1024, 1),
+                                  'ttfb_ms': round(sorted(timings)[REPEATS // 2] * 1000, 2)}
+        history.append(assistant)
+    await main.close_http_clients()
+    return {'mode': mode, 'turns': samples}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--modes', default='full,session')
+    parser.add_argument('--turns', type=int, default=40)
+    parser.add_argument('--turn-kb', type=int, default=2)
+    parser.add_argument('--image-kb', type=int, default=1024)
+    args = parser.parse_args()
+    os.environ.update(server_env(0, {}))
+    fake = start_process([sys.executable, '-m', 'uvicorn', 'fake_upstreams:app', '--port', str(FAKE_PORT),
+                          '--log-level', 'warning'], BENCH_DIR,
+                         {'FAKE_FIRST_TOKEN_MS': '0', 'FAKE_TOKEN_COUNT': '1', 'FAKE_TOKEN_INTERVAL_MS': '0'})
+    try:
+        wait_for_port(FAKE_PORT)
+        report = [asyncio.run(run(mode, args.turns, args.turn_kb, args.image_kb)) for mode in args.modes.split(',')]
+    finally:
+        fake.terminate()
+        fake.wait()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""Count ASGI body writes and bytes per write of /api/openai for several coalescing
+windows, proxying the fake OpenAI stream of fake_upstreams.py.
+
+    python bench_sse_framing.py --windows off,0,10,20 --responses 20
+
+`off` forwards every upstream read unchanged, as the proxy did before framing.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+from bench_streaming import BENCH_DIR, FAKE_PORT, start_process, wait_for_port
+
+sys.path.insert(0, os.path.join(BENCH_DIR, '..', 'src'))
+
+
+async def call_app(app, path: str, body: bytes, headers: list) -> dict:
+    """Call the ASGI app directly and record every response body write."""
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'POST',
+        'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': b'',
+        'root_path': '', 'client': ('127.0.0.1', 1), 'server': ('127.0.0.1', 80),
+        'headers': [(b'content-type', b'application/json'),
+                    (b'content-length', str(len(body)).encode()),
+                    *headers],
+    }
+    messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+    finished = asyncio.Event()
+    writes = []
+    start = time.perf_counter()
+    first_write = None
+    status = None
+    response_headers = {}
+    error = False
+
+    async def receive():
+        if messages:
+            return messages.pop(0)
+        await finished.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(message):
+        nonlocal first_write, status, error
+        if message['type'] == 'http.response.start':
+            status = message['status']
+            response_headers.update((name.decode(), value.decode()) for name, value in message.get('headers', []))
+        if message['type'] == 'http.response.body' and message.get('body'):
+            if first_write is None:
+                first_write = time.perf_counter() - start
+            error = error or message['body'].startswith(b'Error:')
+            writes.append(len(message['body']))
+        if message['type'] == 'http.response.body' and not message.get('more_body'):
+            finished.set()
+
+    await app(scope, receive, send)
+    return {'writes': len(writes), 'bytes': sum(writes), 'first_write': first_write, 'status': status,
+            'error': error, 'elapsed': time.perf_counter() - start, 'headers': response_headers}
+
+
+async def passthrough(chunks, _):
+    async for chunk in chunks:
+        if chunk:
+            yield chunk
+
+
+async def run(window: str, responses: int) -> dict:
+    import main
+    import sse
+    if window == 'off':
+        main.coalesce_sse = passthrough
+    else:
+        main.coalesce_sse = sse.coalesce_sse
+        sse.SSE_COALESCE_WINDOW = float(window) / 1000
+
+    body = json.dumps({'model': 'bench', 'messages': [{'role': 'user', 'content': 'Hi'}],
+                       'stream': True, 'stream_options': {'include_usage': True}}).encode()
+    headers = [(b'authorization', b'Bearer bench'),
+               (b'request_url', f'http://127.0.0.1:{FAKE_PORT}/v1/chat/completions'.encode())]
+    results = await asyncio.gather(*(call_app(main.app, '/api/openai', body, headers) for _ in range(responses)))
+    await main.close_http_clients()
+    writes = sum(result['writes'] for result in results)
+    total_bytes = sum(result['bytes'] for result in results)
+    first_writes = sorted(result['first_write'] for result in results)
+    return {
+        'window_ms': window,
+        'responses': responses,
+        'writes_per_response': round(writes / responses, 1),
+        'bytes_per_write': round(total_bytes / writes, 1),
+        'first_write_p50_ms': round(first_writes[len(first_writes) // 2] * 1000, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--windows', default='off,0,10,20')
+    parser.add_argument('--responses', type=int, default=20)
+    args = parser.parse_args()
+    fake = start_process([sys.executable, '-m', 'uvicorn', 'fake_upstreams:app',
+                          '--port', str(FAKE_PORT), '--log-level', 'warning'], BENCH_DIR, {})
+    try:
+        wait_for_port(FAKE_PORT)
+        report = [asyncio.run(run(window, args.responses)) for window in args.windows.split(',')]
+    finally:
+        fake.terminate()
+        fake.wait()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
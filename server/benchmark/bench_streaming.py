@@ -0,0 +1,133 @@
+"""Compare concurrent-stream capacity and time to first byte of the sync and async
+/api/converse/v3 paths (BEDROCK_STREAM_MODE) against the local fake Bedrock.
+
+    python bench_streaming.py --streams 500
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.join(BENCH_DIR, '..', 'src')
+FAKE_PORT = 9000
+API_KEY = 'bench-key'
+
+
+def start_process(args, cwd, env):
+    return subprocess.Popen(args, cwd=cwd, env={**os.environ, **env},
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def wait_for_port(port: int, timeout: float = 20):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            httpx.get(f'http://127.0.0.1:{port}/', timeout=1)
+            return
+        except httpx.TransportError:
+            time.sleep(0.2)
+    raise RuntimeError(f'port {port} did not open')
+
+
+def server_env(port: int, extra: dict) -> dict:
+    fake_url = f'http://127.0.0.1:{FAKE_PORT}'
+    return {
+        'PORT': str(port),
+        'API_KEY_NAME': 'bench',
+        'AWS_ACCESS_KEY_ID': 'bench',
+        'AWS_SECRET_ACCESS_KEY': 'bench',
+        'AWS_DEFAULT_REGION': 'us-west-2',
+        'AWS_ENDPOINT_URL_BEDROCK_RUNTIME': fake_url,
+        'AWS_ENDPOINT_URL_BEDROCK': fake_url,
+        'AWS_ENDPOINT_URL_SSM': fake_url,
+        'AWS_ENDPOINT_URL_STS': fake_url,
+        **extra
+    }
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+async def run_stream(client: httpx.AsyncClient, url: str, results: dict):
+    body = {
+        'messages': [{'role': 'user', 'content': [{'text': 'Hi'}]}],
+        'modelId': 'us.anthropic.claude-3-7-sonnet-20250219-v1:0',
+        'region': 'us-west-2'
+    }
+    start = time.perf_counter()
+    first_byte = None
+    try:
+        async with client.stream('POST', url, json=body,
+                                 headers={'Authorization': f'Bearer {API_KEY}'}) as response:
+            async for chunk in response.aiter_bytes():
+                if first_byte is None:
+                    first_byte = time.perf_counter() - start
+                if chunk.startswith(b'Error'):
+                    raise RuntimeError(chunk.decode())
+        results['ttfb'].append(first_byte)
+        results['duration'].append(time.perf_counter() - start)
+    except Exception:
+        results['failed'] += 1
+
+
+async def drive(port: int, streams: int) -> dict:
+    results = {'ttfb': [], 'duration': [], 'failed': 0}
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    async with httpx.AsyncClient(limits=limits, timeout=httpx.Timeout(300)) as client:
+        url = f'http://127.0.0.1:{port}/api/converse/v3'
+        await run_stream(client, url, {'ttfb': [], 'duration': [], 'failed': 0})
+        start = time.perf_counter()
+        await asyncio.gather(*(run_stream(client, url, results) for _ in range(streams)))
+        wall = time.perf_counter() - start
+    return {
+        'streams': streams,
+        'completed': len(results['duration']),
+        'failed': results['failed'],
+        'wall_seconds': round(wall, 3),
+        'ttfb_p50_ms': round(percentile(results['ttfb'], 0.5) * 1000, 1) if results['ttfb'] else None,
+        'ttfb_p99_ms': round(percentile(results['ttfb'], 0.99) * 1000, 1) if results['ttfb'] else None,
+        'duration_mean_s': round(statistics.mean(results['duration']), 3) if results['duration'] else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--streams', type=int, default=200)
+    parser.add_argument('--modes', default='sync,async')
+    args = parser.parse_args()
+
+    fake = start_process([sys.executable, '-m', 'uvicorn', 'fake_upstreams:app',
+                          '--port', str(FAKE_PORT), '--log-level', 'warning'], BENCH_DIR, {})
+    report = []
+    try:
+        wait_for_port(FAKE_PORT)
+        for index, mode in enumerate(args.modes.split(',')):
+            port = 8100 + index
+            server = start_process([sys.executable, 'main.py'], SRC_DIR,
+                                   server_env(port, {'BEDROCK_STREAM_MODE': mode}))
+            try:
+                wait_for_port(port)
+                result = asyncio.run(drive(port, args.streams))
+                report.append({'mode': mode, **result})
+            finally:
+                server.terminate()
+                server.wait()
+    finally:
+        fake.terminate()
+        fake.wait()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""Measure /api/converse/v3 requests per second of `python main.py` with 1 to N
+WORKERS against the fake Bedrock of fake_upstreams.py.
+
+Each request carries an image of --image-kb, so JSON parsing and base64 decoding
+dominate the server's CPU time, and streams --tokens events. The load generator
+runs in --clients processes of --concurrency connections each; on a machine with
+fewer cores than workers plus clients the numbers only show contention.
+
+    python bench_workers.py --workers 1,2,4 --seconds 20
+"""
+import argparse
+import asyncio
+import base64
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+import httpx
+
+from bench_streaming import API_KEY, FAKE_PORT, SRC_DIR, BENCH_DIR, percentile, server_env, start_process, \
+    wait_for_port
+
+SERVER_PORT = 8096
+
+
+def build_body(image_kb: int) -> bytes:
+    image = base64.b64encode(os.urandom(image_kb * 1024)).decode()
+    return json.dumps({'messages': [{'role': 'user', 'content': [
+        {'text': 'What is in this image?'}, {'image': {'format': 'png', 'source': {'bytes': image}}}]}],
+        'modelId': 'us.anthropic.claude-3-7-sonnet-20250219-v1:0', 'region': 'us-west-2'}).encode()
+
+
+async def drive(concurrency: int, seconds: float, image_kb: int) -> list:
+    body = build_body(image_kb)
+    headers = {'Authorization': f'Bearer {API_KEY}', 'Content-Type': 'application/json'}
+    url = f'http://127.0.0.1:{SERVER_PORT}/api/converse/v3'
+    deadline = time.perf_counter() + seconds
+    latencies = []
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=120) as client:
+        async def worker():
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                async with client.stream('POST', url, content=body, headers=headers) as response:
+                    async for _ in response.aiter_raw():
+                        pass
+                if response.status_code == 200:
+                    latencies.append(time.perf_counter() - start)
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies
+
+
+def run_client(args: tuple, results):
+    results.put(asyncio.run(drive(*args)))
+
+
+def measure(workers: int, args) -> dict:
+    env = server_env(SERVER_PORT, {'WORKERS': str(workers)})
+    server = start_process([sys.executable, 'main.py'], SRC_DIR, env)
+    try:
+        wait_for_port(SERVER_PORT)
+        # one request per worker first, so process start-up stays out of the numbers
+        asyncio.run(drive(workers, 0.5, args.image_kb))
+        results = multiprocessing.Queue()
+        clients = [multiprocessing.Process(target=run_client, args=(
+            (args.concurrency, args.seconds, args.image_kb), results)) for _ in range(args.clients)]
+        for client in clients:
+            client.start()
+        latencies = [latency for _ in clients for latency in results.get()]
+        for client in clients:
+            client.join()
+    finally:
+        server.terminate()
+        server.wait()
+    return {
+        'workers': workers,
+        'requests': len(latencies),
+        'requests_per_second': round(len(latencies) / args.seconds, 1),
+        'p50_ms': round(percentile(latencies, 0.5) * 1000) if latencies else None,
+        'p99_ms': round(percentile(latencies, 0.99) * 1000) if latencies else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', default='1,2')
+    parser.add_argument('--seconds', type=float, default=20)
+    parser.add_argument('--clients', type=int, default=2)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--image-kb', type=int, default=256)
+    parser.add_argument('--tokens', default='20')
+    args = parser.parse_args()
+    fake = start_process([sys.executable, '-m', 'uvicorn', 'fake_upstreams:app', '--port', str(FAKE_PORT),
+                          '--log-level', 'warning'], BENCH_DIR,
+                         {'FAKE_FIRST_TOKEN_MS': '20', 'FAKE_TOKEN_INTERVAL_MS': '0', 'FAKE_TOKEN_COUNT': args.tokens})
+    try:
+        wait_for_port(FAKE_PORT)
+        report = [measure(int(workers), args) for workers in args.workers.split(',')]
+    finally:
+        fake.terminate()
+        fake.wait()
+    print(json.dumps({'cpus': os.cpu_count(), 'runs': report}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,275 @@
+"""Local stand-in for the AWS endpoints the server calls, for benchmarks only.
+
+Run with `python -m uvicorn fake_upstreams:app --port 9000` and point the server at it with
+the AWS_ENDPOINT_URL_<SERVICE> environment variables. Behaviour is tuned with:
+
+    FAKE_TOKEN_COUNT         number of text deltas per converse stream (default 200)
+    FAKE_TOKEN_INTERVAL_MS   delay between deltas (default 10)
+    FAKE_FIRST_TOKEN_MS      delay before the first delta (default 200)
+    FAKE_CONVERSE_MS         latency of a converse (nova-lite analysis) call (default 800)
+    FAKE_IMAGE_MS            latency of an invoke_model image generation (default 3000)
+    FAKE_IMAGE_KB            size of the generated image, 0 for a 1x1 PNG (default 0)
+    FAKE_CONTROL_MS          latency of list_foundation_models, GetParameter and AssumeRole (default 50)
+    FAKE_PREFILL_MS_PER_1K   delay before messageStart per 1000 uncached input tokens (default 0)
+    FAKE_MAX_STREAMS         streams open at once before converse-stream answers ThrottlingException (default 0, no limit)
+
+Converse streams count about 4 characters of the request per input token. Prefixes
+ending at a cachePoint block are remembered, and a later request repeating one reads
+those tokens from the cache, reported as cacheReadInputTokens and cacheWriteInputTokens
+the way Bedrock does.
+
+GET /fake/stats reports the converse and chat completion streams currently open, the deltas sent and the
+streams the caller closed early, and the request bytes of converse and invoke_model calls.
+
+The OpenAI-compatible /v1/chat/completions stream splits every event across two
+writes, the way TCP reads from a real upstream rarely line up with event boundaries.
+"""
+import asyncio
+import base64
+import binascii
+import hashlib
+import json
+import os
+import struct
+from datetime import datetime, timedelta, timezone
+from urllib.parse import parse_qs
+
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+TOKEN_COUNT = int(os.environ.get("FAKE_TOKEN_COUNT", "200"))
+TOKEN_INTERVAL = float(os.environ.get("FAKE_TOKEN_INTERVAL_MS", "10")) / 1000
+FIRST_TOKEN_DELAY = float(os.environ.get("FAKE_FIRST_TOKEN_MS", "200")) / 1000
+CONVERSE_DELAY = float(os.environ.get("FAKE_CONVERSE_MS", "800")) / 1000
+IMAGE_DELAY = float(os.environ.get("FAKE_IMAGE_MS", "3000")) / 1000
+IMAGE_KB = int(os.environ.get("FAKE_IMAGE_KB", "0"))
+CONTROL_DELAY = float(os.environ.get("FAKE_CONTROL_MS", "50")) / 1000
+PREFILL_DELAY = float(os.environ.get("FAKE_PREFILL_MS_PER_1K", "0")) / 1000
+MAX_STREAMS = int(os.environ.get("FAKE_MAX_STREAMS", "0"))
+API_KEY = os.environ.get("FAKE_API_KEY", "bench-key")
+# a 1x1 PNG
+IMAGE_BASE64 = ('iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNk'
+                '+M9QDwADhgGAWjR9awAAAABJRU5ErkJggg==')
+
+# a PNG signature followed by noise, which compresses like real image data
+GENERATED_IMAGE = IMAGE_BASE64 if not IMAGE_KB else base64.b64encode(
+    b'\x89PNG\r\n\x1a\n' + os.urandom(IMAGE_KB * 1024)).decode()
+
+
+def encode_event(event_type: str, payload: dict) -> bytes:
+    headers = b''
+    for name, value in ((':event-type', event_type),
+                        (':content-type', 'application/json'),
+                        (':message-type', 'event')):
+        name_bytes = name.encode()
+        value_bytes = value.encode()
+        headers += struct.pack('!B', len(name_bytes)) + name_bytes
+        headers += struct.pack('!BH', 7, len(value_bytes)) + value_bytes
+    body = json.dumps(payload).encode()
+    total_length = 16 + len(headers) + len(body)
+    prelude = struct.pack('!II', total_length, len(headers))
+    prelude += struct.pack('!I', binascii.crc32(prelude))
+    message = prelude + headers + body
+    return message + struct.pack('!I', binascii.crc32(message))
+
+
+open_streams = 0
+throttled_streams = 0
+closed_streams = 0
+sent_tokens = 0
+# request body bytes of converse (analysis) and invoke_model (image) calls
+received_bytes = {'converse': 0, 'invoke': 0}
+# digest of a prompt prefix ending at a cachePoint -> its tokens
+cached_prefixes = {}
+
+
+def read_usage(body: dict) -> dict:
+    digest = hashlib.sha256()
+    total = 0
+    points = []
+    blocks = body.get('system', []) + [block for message in body.get('messages', [])
+                                        for block in message.get('content', [])]
+    for block in blocks:
+        if 'cachePoint' in block:
+            points.append((digest.hexdigest(), total))
+            continue
+        text = json.dumps(block, sort_keys=True).encode()
+        digest.update(text)
+        total += len(text) // 4
+    cache_read = max((tokens for key, tokens in points if key in cached_prefixes), default=0)
+    cache_write = 0
+    if points and points[-1][0] not in cached_prefixes:
+        cache_write = points[-1][1] - cache_read
+    cached_prefixes.update(points)
+    return {'inputTokens': total - cache_read - cache_write, 'cacheReadInputTokens': cache_read,
+            'cacheWriteInputTokens': cache_write}
+
+
+async def converse_stream(request: Request):
+    global open_streams, throttled_streams
+    if MAX_STREAMS and open_streams >= MAX_STREAMS:
+        throttled_streams += 1
+        return JSONResponse({'message': 'Too many requests, please wait before trying again.'}, status_code=429,
+                            headers={'x-amzn-ErrorType': 'ThrottlingException'})
+    usage = read_usage(json.loads(await request.body()))
+    prefill = PREFILL_DELAY * (usage['inputTokens'] + usage['cacheWriteInputTokens']) / 1000
+    return StreamingResponse(track_stream(stream_events(usage, prefill)),
+                             media_type='application/vnd.amazon.eventstream')
+
+
+async def track_stream(events):
+    global open_streams, closed_streams
+    open_streams += 1
+    finished = False
+    try:
+        async for event in events:
+            yield event
+        finished = True
+    finally:
+        open_streams -= 1
+        closed_streams += not finished
+
+
+async def stream_events(usage: dict, prefill: float):
+    global sent_tokens
+    if prefill:
+        await asyncio.sleep(prefill)
+    yield encode_event('messageStart', {'role': 'assistant', 'p': 'abcd'})
+    await asyncio.sleep(FIRST_TOKEN_DELAY)
+    for index in range(TOKEN_COUNT):
+        sent_tokens += 1
+        yield encode_event('contentBlockDelta', {'contentBlockIndex': 0,
+                                                 'delta': {'text': f'token{index} '},
+                                                 'p': 'abcdefgh'})
+        await asyncio.sleep(TOKEN_INTERVAL)
+    yield encode_event('contentBlockStop', {'contentBlockIndex': 0})
+    yield encode_event('messageStop', {'stopReason': 'end_turn'})
+    input_tokens = usage['inputTokens'] + usage['cacheReadInputTokens'] + usage['cacheWriteInputTokens']
+    yield encode_event('metadata', {'usage': {**usage,
+                                              'outputTokens': TOKEN_COUNT,
+                                              'totalTokens': TOKEN_COUNT + input_tokens},
+                                    'metrics': {'latencyMs': 100}})
+
+
+async def converse(request: Request):
+    received_bytes['converse'] += len(await request.body())
+    body = await request.json()
+    system = body.get('system', [{}])[0].get('text', '')
+    if 'garment' in system:
+        text = '{"garment_class": "UPPER_BODY"}'
+    elif 'target_task_type' in system:
+        text = '{"target_task_type": "IMAGE_VARIATION", "optimized_prompt": "a cat in the snow"}'
+    else:
+        text = 'a cat in the snow'
+    await asyncio.sleep(CONVERSE_DELAY)
+    return JSONResponse({'output': {'message': {'role': 'assistant', 'content': [{'text': text}]}},
+                         'stopReason': 'end_turn',
+                         'usage': {'inputTokens': 100, 'outputTokens': 20, 'totalTokens': 120},
+                         'metrics': {'latencyMs': int(CONVERSE_DELAY * 1000)}})
+
+
+async def invoke_model(request: Request):
+    received_bytes['invoke'] += len(await request.body())
+    await asyncio.sleep(IMAGE_DELAY)
+    return JSONResponse({'images': [GENERATED_IMAGE]})
+
+
+def model_summary(model_id: str, name: str, output: str, inference_types: list) -> dict:
+    return {'modelArn': f'arn:aws:bedrock:us-west-2::foundation-model/{model_id}', 'modelId': model_id,
+            'modelName': name, 'providerName': name.split()[0], 'inputModalities': ['TEXT'],
+            'outputModalities': [output], 'responseStreamingSupported': output == 'TEXT',
+            'customizationsSupported': [], 'inferenceTypesSupported': inference_types,
+            'modelLifecycle': {'status': 'ACTIVE'}}
+
+
+MODEL_SUMMARIES = [
+    model_summary('anthropic.claude-3-7-sonnet-20250219-v1:0', 'Claude 3.7 Sonnet', 'TEXT', ['INFERENCE_PROFILE']),
+    model_summary('amazon.nova-lite-v1:0', 'Nova Lite', 'TEXT', ['ON_DEMAND', 'INFERENCE_PROFILE']),
+    model_summary('amazon.nova-pro-v1:0', 'Nova Pro', 'TEXT', ['ON_DEMAND', 'INFERENCE_PROFILE']),
+    model_summary('meta.llama3-70b-instruct-v1:0', 'Llama 3 70B Instruct', 'TEXT', ['ON_DEMAND']),
+    model_summary('amazon.nova-canvas-v1:0', 'Nova Canvas', 'IMAGE', ['ON_DEMAND']),
+    model_summary('stability.stable-image-core-v1:0', 'Stable Image Core', 'IMAGE', ['ON_DEMAND']),
+]
+
+
+async def list_foundation_models(_: Request):
+    await asyncio.sleep(CONTROL_DELAY)
+    return JSONResponse({'modelSummaries': MODEL_SUMMARIES})
+
+
+async def assume_role(form: dict) -> Response:
+    await asyncio.sleep(CONTROL_DELAY)
+    expiration = (datetime.now(timezone.utc) + timedelta(seconds=int(form.get('DurationSeconds', ['3600'])[0])))
+    body = f"""<AssumeRoleResponse xmlns="https://sts.amazonaws.com/doc/2011-06-15/">
+  <AssumeRoleResult>
+    <Credentials>
+      <AccessKeyId>ASIABENCH</AccessKeyId>
+      <SecretAccessKey>bench-secret</SecretAccessKey>
+      <SessionToken>bench-token</SessionToken>
+      <Expiration>{expiration.strftime('%Y-%m-%dT%H:%M:%SZ')}</Expiration>
+    </Credentials>
+    <AssumedRoleUser>
+      <AssumedRoleId>AROABENCH:{form['RoleSessionName'][0]}</AssumedRoleId>
+      <Arn>{form['RoleArn'][0]}</Arn>
+    </AssumedRoleUser>
+  </AssumeRoleResult>
+  <ResponseMetadata><RequestId>bench</RequestId></ResponseMetadata>
+</AssumeRoleResponse>"""
+    return Response(body, media_type='text/xml')
+
+
+async def json_rpc(request: Request):
+    """Answer the AWS query (STS) and JSON 1.1 (SSM) protocols, which both POST to /."""
+    if request.headers.get('content-type', '').startswith('application/x-www-form-urlencoded'):
+        form = parse_qs((await request.body()).decode())
+        if form.get('Action') == ['AssumeRole']:
+            return await assume_role(form)
+        return Response('<ErrorResponse><Error><Code>InvalidAction</Code></Error></ErrorResponse>',
+                        status_code=400, media_type='text/xml')
+    target = request.headers.get('x-amz-target', '')
+    if target.endswith('GetParameter'):
+        await asyncio.sleep(CONTROL_DELAY)
+        body = await request.json()
+        return JSONResponse({'Parameter': {'Name': body['Name'], 'Type': 'SecureString',
+                                           'Value': API_KEY, 'Version': 1}},
+                            media_type='application/x-amz-json-1.1')
+    return JSONResponse({'__type': 'UnknownOperationException'}, status_code=400)
+
+
+async def chat_completions(_: Request):
+    async def events():
+        global sent_tokens
+        await asyncio.sleep(FIRST_TOKEN_DELAY)
+        for index in range(TOKEN_COUNT):
+            sent_tokens += 1
+            event = 'data: ' + json.dumps({'id': 'bench', 'object': 'chat.completion.chunk',
+                                           'choices': [{'index': 0, 'delta': {'content': f'token{index} '}}]})
+            event = (event + '\n\n').encode()
+            middle = len(event) // 2
+            yield event[:middle]
+            yield event[middle:]
+            await asyncio.sleep(TOKEN_INTERVAL)
+        usage = {'prompt_tokens': 10, 'completion_tokens': TOKEN_COUNT, 'total_tokens': TOKEN_COUNT + 10}
+        yield ('data: ' + json.dumps({'id': 'bench', 'choices': [], 'usage': usage}) + '\n\n').encode()
+        yield b'data: [DONE]\n\n'
+
+    return StreamingResponse(track_stream(events()), media_type='text/event-stream')
+
+
+async def stats(_: Request):
+    return JSONResponse({'open_streams': open_streams, 'closed_streams': closed_streams,
+                         'throttled_streams': throttled_streams, 'sent_tokens': sent_tokens,
+                         'received_bytes': received_bytes})
+
+
+app = Starlette(routes=[
+    Route('/fake/stats', stats, methods=['GET']),
+    Route('/v1/chat/completions', chat_completions, methods=['POST']),
+    Route('/model/{model_id:path}/converse-stream', converse_stream, methods=['POST']),
+    Route('/model/{model_id:path}/converse', converse, methods=['POST']),
+    Route('/model/{model_id:path}/invoke', invoke_model, methods=['POST']),
+    Route('/foundation-models', list_foundation_models, methods=['GET']),
+    Route('/', json_rpc, methods=['POST']),
+])
@@ -0,0 +1,261 @@
+"""Load-test the server against the local fake upstreams of fake_upstreams.py.
+
+Starts the fake Bedrock/SSM/STS/OpenAI upstream and the server (`main.app` under
+uvicorn, as in the container), then drives each scenario with `--concurrency`
+parallel clients until `--requests` requests have finished:
+
+    converse_v3   streams from /api/converse/v3
+    openai        streams from /api/openai through the fake OpenAI endpoint
+    image         /api/image generations
+    models        /api/models lookups
+    token         /api/token credentials
+
+    python load_test.py --concurrency 1000 --scenarios converse_v3,openai --output run.json
+    python load_test.py --concurrency 1000 --compare run.json
+
+The report is JSON: throughput, p50/p99 time to first byte and latency per
+scenario, plus the server's event-loop lag and RSS sampled while the scenario
+ran. --compare adds the relative change of each number against an earlier report.
+All processes share the machine, so compare runs made on the same host.
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+import httpx
+
+from bench_streaming import API_KEY, BENCH_DIR, FAKE_PORT, SRC_DIR, percentile, server_env, start_process, \
+    wait_for_port
+
+SERVER_PORT = 8095
+LAG_INTERVAL = 0.02
+SCENARIOS = ('converse_v3', 'openai', 'image', 'models', 'token')
+
+
+def read_rss_mb() -> float:
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def serve(port: int):
+    """Run main.app with a loop-lag and RSS sampler and a /bench/stats route to read them."""
+    sys.path.insert(0, SRC_DIR)
+    import uvicorn
+    from fastapi.responses import JSONResponse
+    import main
+
+    samples = {'lag': [], 'rss': []}
+    sampler = []
+
+    async def sample():
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(LAG_INTERVAL)
+            samples['lag'].append(loop.time() - start - LAG_INTERVAL)
+            samples['rss'].append(read_rss_mb())
+
+    @main.app.get('/bench/stats')
+    async def bench_stats(reset: bool = False):
+        if not sampler:
+            sampler.append(asyncio.create_task(sample()))
+        lag = sorted(samples['lag']) or [0.0]
+        rss = samples['rss'] or [read_rss_mb()]
+        stats = {
+            'loop_lag_p50_ms': round(percentile(lag, 0.5) * 1000, 2),
+            'loop_lag_p99_ms': round(percentile(lag, 0.99) * 1000, 2),
+            'loop_lag_max_ms': round(lag[-1] * 1000, 2),
+            'rss_mb': round(rss[-1], 1),
+            'rss_peak_mb': round(max(rss), 1),
+        }
+        if reset:
+            samples['lag'].clear()
+            samples['rss'].clear()
+        return JSONResponse(stats)
+
+    uvicorn.run(main.app, host='127.0.0.1', port=port, log_level='warning')
+
+
+def build_request(scenario: str) -> dict:
+    headers = {'Authorization': f'Bearer {API_KEY}'}
+    if scenario == 'converse_v3':
+        body = {'messages': [{'role': 'user', 'content': [{'text': 'Hi'}]}],
+                'modelId': 'us.anthropic.claude-3-7-sonnet-20250219-v1:0', 'region': 'us-west-2'}
+        return {'url': '/api/converse/v3', 'json': body, 'headers': headers}
+    if scenario == 'openai':
+        body = {'model': 'bench', 'messages': [{'role': 'user', 'content': 'Hi'}],
+                'stream': True, 'stream_options': {'include_usage': True}}
+        return {'url': '/api/openai', 'json': body,
+                'headers': {**headers, 'request_url': f'http://127.0.0.1:{FAKE_PORT}/v1/chat/completions'}}
+    if scenario == 'image':
+        body = {'prompt': 'a cat in the snow', 'modelId': 'amazon.nova-canvas-v1:0', 'region': 'us-west-2',
+                'width': 1024, 'height': 1024}
+        return {'url': '/api/image', 'json': body, 'headers': headers}
+    if scenario == 'models':
+        return {'url': '/api/models', 'json': {'region': 'us-west-2'}, 'headers': headers}
+    if scenario == 'token':
+        return {'url': '/api/token', 'json': {'region': 'us-west-2'}, 'headers': headers}
+    raise ValueError(f'unknown scenario {scenario}')
+
+
+async def timed_request(client: httpx.AsyncClient, request: dict) -> dict:
+    start = time.perf_counter()
+    first_byte = None
+    received = 0
+    async with client.stream('POST', request['url'], json=request['json'], headers=request['headers']) as response:
+        async for chunk in response.aiter_bytes():
+            if first_byte is None:
+                first_byte = time.perf_counter() - start
+            received += len(chunk)
+            if chunk.startswith(b'Error'):
+                raise RuntimeError(chunk[:200].decode(errors='replace'))
+        if response.status_code >= 400:
+            raise RuntimeError(f'HTTP {response.status_code}')
+    return {'ttfb': first_byte if first_byte is not None else time.perf_counter() - start,
+            'latency': time.perf_counter() - start, 'bytes': received}
+
+
+async def run_scenario(scenario: str, concurrency: int, requests: int) -> dict:
+    base_url = f'http://127.0.0.1:{SERVER_PORT}'
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    results = []
+    errors = {}
+    remaining = requests
+    request = build_request(scenario)
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=600) as client:
+        await client.get('/bench/stats', params={'reset': 'true'})
+
+        async def worker():
+            nonlocal remaining
+            while remaining > 0:
+                remaining -= 1
+                try:
+                    results.append(await timed_request(client, request))
+                except Exception as error:
+                    message = str(error)[:120] or type(error).__name__
+                    errors[message] = errors.get(message, 0) + 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        wall = time.perf_counter() - start
+        server = (await client.get('/bench/stats', params={'reset': 'true'})).json()
+
+    ttfb = [result['ttfb'] for result in results]
+    latency = [result['latency'] for result in results]
+    return {
+        'scenario': scenario,
+        'concurrency': concurrency,
+        'requests': requests,
+        'completed': len(results),
+        'errors': errors,
+        'wall_seconds': round(wall, 2),
+        'throughput_rps': round(len(results) / wall, 1),
+        'throughput_mb_s': round(sum(result['bytes'] for result in results) / wall / 1024 / 1024, 2),
+        'ttfb_p50_ms': round(percentile(ttfb, 0.5) * 1000, 1) if ttfb else None,
+        'ttfb_p99_ms': round(percentile(ttfb, 0.99) * 1000, 1) if ttfb else None,
+        'latency_p50_ms': round(percentile(latency, 0.5) * 1000, 1) if latency else None,
+        'latency_p99_ms': round(percentile(latency, 0.99) * 1000, 1) if latency else None,
+        'server': server,
+    }
+
+
+def compare(report: dict, baseline: dict) -> dict:
+    """Relative change of every numeric field per scenario, e.g. 0.1 for 10% higher."""
+    previous = {entry['scenario']: entry for entry in baseline['scenarios']}
+    changes = {}
+    for entry in report['scenarios']:
+        before = previous.get(entry['scenario'])
+        if before is None:
+            continue
+        current = {**entry, **{f'server_{key}': value for key, value in entry['server'].items()}}
+        old = {**before, **{f'server_{key}': value for key, value in before['server'].items()}}
+        changes[entry['scenario']] = {
+            key: round(value / old[key] - 1, 3)
+            for key, value in current.items()
+            if isinstance(value, (int, float)) and isinstance(old.get(key), (int, float)) and old[key]
+            and key not in ('concurrency', 'requests')
+        }
+    return {'baseline_commit': baseline.get('commit'), 'changes': changes}
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BENCH_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS))
+    parser.add_argument('--concurrency', type=int, default=200)
+    parser.add_argument('--requests', type=int, default=0, help='per scenario, defaults to 2 x concurrency')
+    parser.add_argument('--token-count', default='200')
+    parser.add_argument('--token-interval-ms', default='10')
+    parser.add_argument('--first-token-ms', default='200')
+    parser.add_argument('--image-ms', default='3000')
+    parser.add_argument('--server-env', action='append', default=[], metavar='NAME=VALUE',
+                        help='extra environment for the server, e.g. SSE_COALESCE_WINDOW_MS=0')
+    parser.add_argument('--output')
+    parser.add_argument('--compare')
+    parser.add_argument('--serve', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--port', type=int, default=SERVER_PORT, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.serve:
+        serve(args.port)
+        return
+
+    fake_env = {'FAKE_TOKEN_COUNT': args.token_count, 'FAKE_TOKEN_INTERVAL_MS': args.token_interval_ms,
+                'FAKE_FIRST_TOKEN_MS': args.first_token_ms, 'FAKE_IMAGE_MS': args.image_ms}
+    extra = dict(item.split('=', 1) for item in args.server_env)
+    extra.setdefault('CLIENT_ROLE_ARN', 'arn:aws:iam::123456789012:role/bench')
+    # the fake and the load generator need file descriptors for every open stream too
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+    fake = start_process([sys.executable, '-m', 'uvicorn', 'fake_upstreams:app', '--port', str(FAKE_PORT),
+                          '--log-level', 'warning', '--backlog', '4096'], BENCH_DIR, fake_env)
+    server = start_process([sys.executable, os.path.abspath(__file__), '--serve', '--port', str(SERVER_PORT)],
+                           BENCH_DIR, server_env(SERVER_PORT, extra))
+    try:
+        wait_for_port(FAKE_PORT)
+        wait_for_port(SERVER_PORT)
+        requests = args.requests or args.concurrency * 2
+        scenarios = [asyncio.run(run_scenario(scenario, args.concurrency, requests))
+                     for scenario in args.scenarios.split(',')]
+    finally:
+        for process in (server, fake):
+            process.terminate()
+            process.wait()
+
+    report = {
+        'commit': git_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'config': {key: value for key, value in vars(args).items() if key not in ('serve', 'port', 'output', 'compare')},
+        'scenarios': scenarios,
+    }
+    if args.compare:
+        with open(args.compare) as baseline:
+            report['compare'] = compare(report, json.load(baseline))
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as file:
+            file.write(output + '\n')
+    print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,205 @@
+import asyncio
+import math
+import os
+import random
+import time
+from collections import deque
+
+from fastapi import HTTPException
+
+from metrics import Counter, Histogram, add_collector, get_error_code
+
+MAX_CONCURRENCY = int(os.environ.get("BEDROCK_MAX_CONCURRENCY", "0"))
+MAX_QUEUE = int(os.environ.get("BEDROCK_MAX_QUEUE", "100"))
+QUEUE_TIMEOUT = float(os.environ.get("BEDROCK_QUEUE_TIMEOUT", "30"))
+RETRY_ATTEMPTS = int(os.environ.get("BEDROCK_RETRY_ATTEMPTS", "3"))
+RETRY_BASE_DELAY = float(os.environ.get("BEDROCK_RETRY_BASE_MS", "250")) / 1000
+RETRY_MAX_DELAY = float(os.environ.get("BEDROCK_RETRY_MAX_MS", "4000")) / 1000
+RETRYABLE_CODES = {"throttlingexception", "toomanyrequestsexception", "serviceunavailableexception",
+                   "modelnotreadyexception", "internalserverexception", "servicequotaexceededexception",
+                   "429", "500", "502", "503", "504"}
+CROSS_REGION_PREFIXES = ("us.", "eu.", "apac.")
+
+# e.g. "us=us-west-2,eu=eu-central-1,apac=ap-northeast-1"
+FALLBACK_REGIONS = dict(item.split("=", 1) for item in os.environ.get("BEDROCK_FALLBACK_REGIONS", "").split(",")
+                        if "=" in item)
+
+retries = Counter("swiftchat_bedrock_retries_total", "Bedrock calls retried before their first event.",
+                  ("endpoint", "model", "region", "code"))
+rejections = Counter("swiftchat_admission_rejections_total",
+                     "Requests answered with 429 because the model's queue was full or the wait timed out.",
+                     ("model", "region"))
+queue_wait = Histogram("swiftchat_admission_wait_seconds", "Time requests waited for a model concurrency slot.",
+                       ("model", "region"))
+
+_limiters = {}
+
+
+class LimiterFull(Exception):
+    pass
+
+
+class ConcurrencyLimiter:
+    """An asyncio semaphore with a bounded FIFO wait queue.
+
+    A released slot is handed straight to the oldest waiter, so a burst cannot
+    overtake requests already queued.
+    """
+
+    def __init__(self, limit: int, max_queue: int):
+        self.limit = limit
+        self.max_queue = max_queue
+        self.active = 0
+        self.waiters = deque()
+        # smoothed seconds a slot is held, for the Retry-After estimate
+        self.hold_time = 1.0
+
+    @property
+    def idle(self) -> bool:
+        return self.active == 0 and not self.waiters
+
+    def retry_after(self) -> int:
+        return max(1, math.ceil(self.hold_time * (len(self.waiters) + 1) / self.limit))
+
+    async def acquire(self, timeout: float):
+        if self.active < self.limit and not self.waiters:
+            self.active += 1
+            return
+        if len(self.waiters) >= self.max_queue:
+            raise LimiterFull()
+        future = asyncio.get_running_loop().create_future()
+        self.waiters.append(future)
+        try:
+            await asyncio.wait_for(future, timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as error:
+            if future.done() and not future.cancelled():
+                # the slot was handed over while we were giving up, pass it on
+                self.release(0)
+            elif future in self.waiters:
+                # release() may already have popped the cancelled future while wait_for cancelled it
+                self.waiters.remove(future)
+            if isinstance(error, asyncio.TimeoutError):
+                raise LimiterFull() from error
+            raise
+
+    def release(self, held: float):
+        if held:
+            self.hold_time = self.hold_time * 0.9 + held * 0.1
+        while self.waiters:
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+
+def drop_if_idle(key: tuple, limiter: ConcurrencyLimiter):
+    # only the limiter in use: a later request may have created a new one for the key
+    if limiter.idle and _limiters.get(key) is limiter:
+        del _limiters[key]
+
+
+class Permit:
+    """A held slot; release is idempotent so the stream and the response can both call it."""
+
+    def __init__(self, key: tuple | None = None, limiter: ConcurrencyLimiter | None = None):
+        self.key = key
+        self.limiter = limiter
+        self.acquired_at = time.monotonic()
+
+    def release(self):
+        if self.limiter is None:
+            return
+        limiter, self.limiter = self.limiter, None
+        limiter.release(time.monotonic() - self.acquired_at)
+        drop_if_idle(self.key, limiter)
+
+
+async def admit(model_id: str, region: str) -> Permit:
+    """Wait for one of the BEDROCK_MAX_CONCURRENCY slots of (model_id, region).
+
+    At most BEDROCK_MAX_QUEUE requests wait, for up to BEDROCK_QUEUE_TIMEOUT
+    seconds; others get 429 with a Retry-After estimated from how long slots are
+    being held.
+    """
+    if MAX_CONCURRENCY <= 0:
+        return Permit()
+    key = (model_id, region)
+    limiter = _limiters.get(key)
+    if limiter is None:
+        limiter = _limiters[key] = ConcurrencyLimiter(MAX_CONCURRENCY, MAX_QUEUE)
+    start = time.monotonic()
+    try:
+        await limiter.acquire(QUEUE_TIMEOUT)
+    except LimiterFull:
+        rejections.inc(model_id, region)
+        drop_if_idle(key, limiter)
+        raise HTTPException(status_code=429,
+                            detail=f"Error: too many concurrent requests for {model_id} in {region}, "
+                                   f"please retry later",
+                            headers={"Retry-After": str(limiter.retry_after())})
+    queue_wait.observe(model_id, region, value=time.monotonic() - start)
+    return Permit(key, limiter)
+
+
+def is_retryable(error) -> bool:
+    import httpx
+    if isinstance(error, httpx.TransportError):
+        return True
+    return get_error_code(error).lower() in RETRYABLE_CODES
+
+
+def get_retry_delay(attempt: int) -> float:
+    # full jitter: spreads out clients that were throttled at the same moment
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+
+
+def get_fallback_region(model_id: str, region: str) -> str | None:
+    for prefix in CROSS_REGION_PREFIXES:
+        if model_id.startswith(prefix):
+            fallback = FALLBACK_REGIONS.get(prefix[:-1])
+            return fallback if fallback != region else None
+    return None
+
+
+async def stream_with_retry(open_stream, endpoint: str, model_id: str, region: str):
+    """Yield the events of open_stream(region), retrying a call that fails with a
+    throttling or availability error before its first event.
+
+    Up to BEDROCK_RETRY_ATTEMPTS calls are made with jittered exponential backoff.
+    Cross-region profile ids alternate between region and the configured
+    BEDROCK_FALLBACK_REGIONS entry of their geography. Once an event has been
+    passed on, errors are raised as they are.
+    """
+    fallback = get_fallback_region(model_id, region)
+    current = region
+    attempt = 0
+    while True:
+        started = False
+        try:
+            async for item in open_stream(current):
+                started = True
+                yield item
+            return
+        except Exception as error:
+            attempt += 1
+            if started or attempt >= RETRY_ATTEMPTS or not is_retryable(error):
+                raise
+            retries.inc(endpoint, model_id, current, get_error_code(error))
+            print(f"Retrying {model_id} in {current} after {get_error_code(error)}")
+            if fallback is not None:
+                current = fallback if current == region else region
+            await asyncio.sleep(get_retry_delay(attempt))
+
+
+def collect_limiters() -> list:
+    return [
+        ("swiftchat_admission_active", "gauge", "Bedrock calls holding a concurrency slot per model and region.",
+         [({"model": model, "region": region}, limiter.active) for (model, region), limiter in _limiters.items()]),
+        ("swiftchat_admission_queued", "gauge", "Requests waiting for a concurrency slot per model and region.",
+         [({"model": model, "region": region}, len(limiter.waiters))
+          for (model, region), limiter in _limiters.items()]),
+    ]
+
+
+add_collector(collect_limiters)
@@ -0,0 +1,99 @@
+import asyncio
+import hmac
+import os
+import re
+import time
+from typing import Annotated
+
+from fastapi import Depends, HTTPException
+from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from starlette.concurrency import run_in_threadpool
+
+from aws_clients import get_client
+
+API_KEY_CACHE_TTL = float(os.environ.get("API_KEY_CACHE_TTL", "300"))
+MISS_REFRESH_INTERVAL = float(os.environ.get("API_KEY_MISS_REFRESH_INTERVAL", "30"))
+
+security = HTTPBearer()
+state = {
+    "keys": [],
+    "fetched_at": 0.0,
+    "last_miss_refresh": 0.0
+}
+_refresh_task = None
+
+
+def read_api_keys() -> list:
+    """Read the API keys from Parameter Store.
+
+    The parameter may hold several keys separated by commas or new lines, so a new
+    key can be added next to the old one while clients move over.
+    """
+    response = get_client('ssm').get_parameter(
+        Name=os.environ['API_KEY_NAME'],
+        WithDecryption=True
+    )
+    value = response['Parameter']['Value']
+    return [key.strip().encode('utf-8') for key in re.split(r'[,\n]', value) if key.strip()]
+
+
+def start_refresh() -> asyncio.Task:
+    global _refresh_task
+    if _refresh_task is None:
+        _refresh_task = asyncio.create_task(run_in_threadpool(read_api_keys))
+        _refresh_task.add_done_callback(on_refresh_done)
+    return _refresh_task
+
+
+def on_refresh_done(task: asyncio.Task):
+    global _refresh_task
+    _refresh_task = None
+    if task.cancelled():
+        return
+    if task.exception() is not None:
+        print(f"Error reading API key from Parameter Store: {task.exception()}")
+        # keep serving the cached keys and retry after MISS_REFRESH_INTERVAL instead of on every request
+        state["fetched_at"] = time.monotonic() - API_KEY_CACHE_TTL + MISS_REFRESH_INTERVAL
+        return
+    state["keys"] = task.result()
+    state["fetched_at"] = time.monotonic()
+
+
+async def refresh_api_keys():
+    try:
+        await asyncio.shield(start_refresh())
+    except Exception as error:
+        if not state["keys"]:
+            raise HTTPException(status_code=401,
+                                detail=f"Error: Please create your API Key in Parameter Store, {str(error)}")
+
+
+def is_valid_api_key(api_key: str) -> bool:
+    candidate = api_key.encode('utf-8')
+    valid = False
+    for key in state["keys"]:
+        # compare against every key so timing doesn't reveal which one matched
+        valid |= hmac.compare_digest(candidate, key)
+    return valid
+
+
+async def verify_api_key(credentials: Annotated[HTTPAuthorizationCredentials, Depends(security)]):
+    """Check the bearer token against the cached API keys without blocking on SSM.
+
+    Keys are loaded once, then refreshed in the background every API_KEY_CACHE_TTL
+    seconds. An unknown key triggers at most one extra read per
+    MISS_REFRESH_INTERVAL, so a newly rotated key works right away.
+    """
+    now = time.monotonic()
+    if not state["keys"]:
+        await refresh_api_keys()
+    elif now - state["fetched_at"] > API_KEY_CACHE_TTL:
+        start_refresh()
+    if is_valid_api_key(credentials.credentials):
+        return credentials.credentials
+    if now - state["last_miss_refresh"] > MISS_REFRESH_INTERVAL:
+        state["last_miss_refresh"] = now
+        await refresh_api_keys()
+        if is_valid_api_key(credentials.credentials):
+            return credentials.credentials
+    raise HTTPException(status_code=401, detail="Invalid API Key")
@@ -0,0 +1,125 @@
+import binascii
+import hashlib
+import os
+
+from fastapi import HTTPException
+from starlette.concurrency import run_in_threadpool
+
+from cache import LRUCache
+
+ATTACHMENT_TYPES = ('image', 'video', 'document')
+MAX_ATTACHMENT_BYTES = int(os.environ.get("MAX_ATTACHMENT_BYTES", str(100 * 1024 * 1024)))
+INLINE_DECODE_BYTES = int(os.environ.get("INLINE_DECODE_BYTES", str(64 * 1024)))
+DECODE_CHUNK_CHARS = 256 * 1024
+HASH_CHUNK_CHARS = 1024 * 1024
+
+attachment_cache = LRUCache(max_bytes=int(os.environ.get("ATTACHMENT_CACHE_MAX_BYTES", str(128 * 1024 * 1024))))
+
+
+def collect_attachment_sources(messages: list) -> tuple[list, int]:
+    sources = []
+    total_bytes = 0
+    for message in messages:
+        if message["role"] == "user":
+            for content in message["content"]:
+                for attachment_type in ATTACHMENT_TYPES:
+                    if attachment_type in content:
+                        source = content[attachment_type]['source']
+                        if isinstance(source.get('bytes'), (str, memoryview)):
+                            sources.append(source)
+                            total_bytes += len(source['bytes']) * 3 // 4
+                        elif 'sha256' in source:
+                            sources.append(source)
+    return sources, total_bytes
+
+
+def decode_base64(data: str | memoryview) -> bytes | bytearray:
+    """Decode base64 text into bytes without an intermediate full-size copy.
+
+    binascii accepts the ASCII str or a memoryview slice of the request body
+    directly (base64.b64decode would first encode a str into a second buffer).
+    Large payloads are decoded chunk by chunk into one preallocated bytearray so
+    the GIL is released to the event loop between chunks.
+    """
+    # body slices come from JSON strings without escapes, so they hold no line breaks
+    if (len(data) <= DECODE_CHUNK_CHARS or len(data) % 4
+            or (isinstance(data, str) and ('\n' in data or '\r' in data or ' ' in data))):
+        return binascii.a2b_base64(data)
+    tail = bytes(data[-2:]) if isinstance(data, memoryview) else data[-2:].encode('ascii')
+    padding = tail.count(b'=')
+    output = bytearray(len(data) // 4 * 3 - padding)
+    view = memoryview(output)
+    position = 0
+    for start in range(0, len(data), DECODE_CHUNK_CHARS):
+        chunk = binascii.a2b_base64(data[start:start + DECODE_CHUNK_CHARS])
+        view[position:position + len(chunk)] = chunk
+        position += len(chunk)
+    if position != len(output):
+        return binascii.a2b_base64(data)
+    return output
+
+
+def hash_base64(data: str | memoryview) -> str:
+    if isinstance(data, memoryview):
+        return hashlib.sha256(data).hexdigest()
+    # hash slice by slice so a large payload is never encoded into one full-size buffer
+    digest = hashlib.sha256()
+    for start in range(0, len(data), HASH_CHUNK_CHARS):
+        digest.update(data[start:start + HASH_CHUNK_CHARS].encode('ascii'))
+    return digest.hexdigest()
+
+
+def resolve_sources(sources: list) -> list:
+    """Replace each source's base64 text or sha256 reference with decoded bytes.
+
+    Returns the sha256 references that are not in the attachment cache.
+    """
+    missing = []
+    for source in sources:
+        if isinstance(source.get('bytes'), (str, memoryview)):
+            source.pop('sha256', None)
+            if not attachment_cache.enabled:
+                source['bytes'] = decode_base64(source['bytes'])
+                continue
+            digest = hash_base64(source['bytes'])
+            data = attachment_cache.get(digest)
+            if data is None:
+                data = decode_base64(source['bytes'])
+                attachment_cache.put(digest, data)
+            source['bytes'] = data
+        else:
+            digest = source.pop('sha256')
+            data = attachment_cache.get(digest)
+            if data is None:
+                missing.append(digest)
+            else:
+                source['bytes'] = data
+    return missing
+
+
+async def decode_attachments(messages: list, max_bytes: int = MAX_ATTACHMENT_BYTES):
+    """Decode base64 attachments of user messages in place.
+
+    The decoded size is checked against max_bytes before anything is decoded, and
+    large payloads are decoded on the threadpool so they don't stall the event loop.
+    Attachments already decoded in an earlier turn come from the attachment cache,
+    and may be sent as {"sha256": <hex digest of the base64 text>} instead of bytes;
+    unknown digests are answered with 409 so the client resends the full payload.
+    """
+    sources, total_bytes = collect_attachment_sources(messages)
+    if total_bytes > max_bytes:
+        raise HTTPException(status_code=413,
+                            detail=f"Error: attachments exceed the {max_bytes} bytes limit")
+    if total_bytes > INLINE_DECODE_BYTES:
+        missing = await run_in_threadpool(resolve_sources, sources)
+    else:
+        missing = resolve_sources(sources)
+    if missing:
+        raise HTTPException(status_code=409, detail={
+            "error": "Error: attachments are not cached, please resend them with bytes",
+            "missingAttachments": missing
+        })
+
+
+def get_attachment_cache_stats() -> dict:
+    return attachment_cache.stats()
@@ -0,0 +1,94 @@
+import os
+import threading
+
+_lock = threading.Lock()
+_session = None
+_clients = {}
+_stats = {
+    "hits": 0,
+    "misses": 0
+}
+
+
+def get_client_config():
+    # boto3 and botocore take a noticeable share of a cold start, so they are only
+    # imported once the first client or credentials are needed
+    from botocore.config import Config
+    return Config(
+        max_pool_connections=int(os.environ.get("BOTO_MAX_POOL_CONNECTIONS", "50")),
+        tcp_keepalive=os.environ.get("BOTO_TCP_KEEPALIVE", "true").lower() == "true",
+        connect_timeout=float(os.environ.get("BOTO_CONNECT_TIMEOUT", "10")),
+        read_timeout=float(os.environ.get("BOTO_READ_TIMEOUT", "120")),
+        retries={
+            "mode": os.environ.get("BOTO_RETRY_MODE", "standard"),
+            "max_attempts": int(os.environ.get("BOTO_MAX_ATTEMPTS", "3"))
+        }
+    )
+
+
+def create_session():
+    import boto3
+    return boto3.session.Session()
+
+
+def get_client(service: str, region: str | None = None):
+    """Return the process-wide client for (service, region), creating it on first use.
+
+    boto3 clients are thread-safe once built, but building them through a shared
+    session is not, so creation is serialized behind a lock.
+    """
+    global _session
+    key = (service, region)
+    client = _clients.get(key)
+    if client is not None:
+        _stats["hits"] += 1
+        return client
+    with _lock:
+        client = _clients.get(key)
+        if client is not None:
+            _stats["hits"] += 1
+            return client
+        if _session is None:
+            _session = create_session()
+        client = _session.client(service, region_name=region, config=get_client_config())
+        _clients[key] = client
+        _stats["misses"] += 1
+        return client
+
+
+def get_credentials():
+    """Return the shared session's credentials, for callers that sign requests themselves."""
+    global _session
+    with _lock:
+        if _session is None:
+            _session = create_session()
+    return _session.get_credentials()
+
+
+def get_client_stats() -> dict:
+    return {
+        "hits": _stats["hits"],
+        "misses": _stats["misses"],
+        "clients": len(_clients)
+    }
+
+
+def clear_clients():
+    global _session
+    with _lock:
+        _clients.clear()
+        _session = None
+
+
+def prewarm_clients(regions: list, services: tuple = ("bedrock-runtime",)):
+    """Build the clients of services for each region, plus the SSM client and the
+    credentials, so a cold start pays for them during init instead of on the first request.
+
+    Each client loads its service model, so only the ones on the path of a first chat
+    request are built by default.
+    """
+    get_client('ssm')
+    for region in regions:
+        for service in services:
+            get_client(service, region)
+    get_credentials()
@@ -0,0 +1,184 @@
+import json
+import os
+from typing import TYPE_CHECKING
+
+from starlette.concurrency import run_in_threadpool
+
+from aws_clients import get_credentials
+from http_clients import get_http_client
+from sse import window_batches
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+if TYPE_CHECKING:
+    import httpx
+
+CONVERSE_COALESCE_WINDOW = float(os.environ.get("CONVERSE_COALESCE_WINDOW_MS", "0")) / 1000
+CONVERSE_COALESCE_MAX_EVENTS = int(os.environ.get("CONVERSE_COALESCE_MAX_EVENTS", "64"))
+
+_codec = {}
+
+
+def get_codec() -> dict:
+    """Build the botocore serializer and parsers on first use, keeping botocore out of startup."""
+    if not _codec:
+        from botocore.parsers import EventStreamJSONParser, create_parser
+        from botocore.serialize import create_serializer
+        _codec["event_parser"] = EventStreamJSONParser()
+        _codec["error_parser"] = create_parser('rest-json')
+        _codec["serializer"] = create_serializer('rest-json')
+    return _codec
+
+
+def get_bedrock_http_client(url: str) -> 'httpx.AsyncClient':
+    return get_http_client(url,
+                           max_connections=int(os.environ.get("BEDROCK_HTTP_MAX_CONNECTIONS", "1000")),
+                           max_keepalive_connections=int(os.environ.get("BEDROCK_HTTP_MAX_KEEPALIVE", "100")),
+                           read_timeout=float(os.environ.get("BOTO_READ_TIMEOUT", "120")),
+                           pool_timeout=float(os.environ.get("BEDROCK_HTTP_POOL_TIMEOUT", "30")),
+                           http2=False)
+
+
+def build_signed_request(client, operation_name: str, params: dict):
+    """Serialize and SigV4-sign a request the same way the boto3 client would."""
+    from botocore.auth import SigV4Auth
+    from botocore.awsrequest import create_request_object, prepare_request_dict
+    from botocore.validate import validate_parameters
+    operation_model = client.meta.service_model.operation_model(operation_name)
+    validate_parameters(params, operation_model.input_shape)
+    request_dict = get_codec()["serializer"].serialize_to_request(params, operation_model)
+    request_dict['headers']['Accept'] = 'application/vnd.amazon.eventstream'
+    prepare_request_dict(request_dict, endpoint_url=client.meta.endpoint_url)
+    request = create_request_object(request_dict)
+    credentials = get_credentials().get_frozen_credentials()
+    SigV4Auth(credentials, client.meta.service_model.signing_name, client.meta.region_name).add_auth(request)
+    return operation_model, request.prepare()
+
+
+def raise_for_error(client, operation_model, status_code: int, headers, body: bytes):
+    parsed = get_codec()["error_parser"].parse({
+        'status_code': status_code,
+        'headers': headers,
+        'body': body
+    }, operation_model.output_shape)
+    error_code = parsed.get('Error', {}).get('Code')
+    error_class = client.exceptions.from_code(error_code)
+    raise error_class(parsed, operation_model.name)
+
+
+async def converse_stream_async(client, command: dict):
+    """Async counterpart of client.converse_stream(**command)['stream'].
+
+    The request is built and signed by botocore, sent over a pooled httpx client
+    and the event stream is decoded on the event loop, so an open stream holds
+    a socket but no worker thread. Serializing and hashing the body takes
+    hundreds of milliseconds for large attachments and a credential refresh
+    blocks, so the request is built on the threadpool.
+    """
+    from botocore.eventstream import EventStreamBuffer
+    from botocore.exceptions import EventStreamError
+    operation_model, request = await run_in_threadpool(build_signed_request, client, 'ConverseStream', command)
+    event_parser = get_codec()["event_parser"]
+    stream_shape = operation_model.output_shape.members['stream']
+    http_client = get_bedrock_http_client(request.url)
+    http_request = http_client.build_request(request.method, request.url,
+                                             headers=dict(request.headers.items()),
+                                             content=request.body)
+    response = await http_client.send(http_request, stream=True)
+    try:
+        if response.status_code >= 300:
+            body = await response.aread()
+            raise_for_error(client, operation_model, response.status_code, response.headers, body)
+        buffer = EventStreamBuffer()
+        async for chunk in response.aiter_raw():
+            buffer.add_data(chunk)
+            for message in buffer:
+                response_dict = message.to_response_dict()
+                parsed = event_parser.parse(response_dict, stream_shape)
+                if response_dict['status_code'] != 200:
+                    raise EventStreamError(parsed, operation_model.name)
+                if parsed:
+                    yield parsed
+    finally:
+        await response.aclose()
+
+
+async def converse_stream_sync(client, command: dict):
+    """client.converse_stream(**command)['stream'] read on the threadpool, one event per hop.
+
+    Closing this generator, e.g. because the client disconnected, closes the
+    botocore event stream, so Bedrock stops generating and the thread is free
+    after its current read rather than at the end of the answer.
+    """
+    response = await run_in_threadpool(lambda: client.converse_stream(**command))
+    stream = response['stream']
+    events = iter(stream)
+    try:
+        while (item := await run_in_threadpool(next, events, None)) is not None:
+            yield item
+    finally:
+        stream.close()
+
+
+def encode_event(item: dict) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(item)
+    return json.dumps(item).encode('utf-8')
+
+
+def get_text_delta_key(event: dict) -> str | None:
+    """Return which text field a plain text or reasoning text delta carries, if any."""
+    block = event.get('contentBlockDelta')
+    if block is None:
+        return None
+    delta = block['delta']
+    if delta.keys() == {'text'}:
+        return 'text'
+    if delta.keys() == {'reasoningContent'} and delta['reasoningContent'].keys() == {'text'}:
+        return 'reasoningContent'
+    return None
+
+
+def merge_text_deltas(events: list) -> list:
+    """Merge adjacent text deltas of the same content block into one event.
+
+    Deltas carrying anything besides text (tool input, reasoning signatures,
+    redacted content) are kept as they are and end the merge.
+    """
+    merged = []
+    previous_key = None
+    for event in events:
+        key = get_text_delta_key(event)
+        if (key is not None and key == previous_key
+                and event['contentBlockDelta']['contentBlockIndex']
+                == merged[-1]['contentBlockDelta']['contentBlockIndex']):
+            previous_delta = merged[-1]['contentBlockDelta']['delta']
+            if key == 'text':
+                previous_delta['text'] += event['contentBlockDelta']['delta']['text']
+            else:
+                previous_delta['reasoningContent']['text'] += \
+                    event['contentBlockDelta']['delta']['reasoningContent']['text']
+            continue
+        merged.append(event)
+        previous_key = key
+    return merged
+
+
+async def coalesce_converse_events(events, separator: bytes, window: float | None = None,
+                                   max_events: int | None = None):
+    """Serialize converse stream events, merging text deltas that arrive within `window`.
+
+    The event schema is unchanged, so a client that splits on the separator sees
+    the same events, only fewer of them and with longer texts.
+    """
+    window = CONVERSE_COALESCE_WINDOW if window is None else window
+    max_events = CONVERSE_COALESCE_MAX_EVENTS if max_events is None else max_events
+    if window <= 0:
+        async for event in events:
+            yield encode_event(event) + separator
+        return
+    async for batch in window_batches(events, window, max_events, size_of=lambda _: 1):
+        yield b''.join(encode_event(event) + separator for event in merge_text_deltas(batch))
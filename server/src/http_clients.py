@@ -0,0 +1,123 @@
+import asyncio
+import importlib.util
+import os
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import TYPE_CHECKING
+from urllib.parse import urlsplit
+
+if TYPE_CHECKING:
+    import httpx
+
+HTTP2_ENABLED = os.environ.get("HTTP_CLIENT_HTTP2", "false").lower() == "true"
+MAX_CONNECTIONS = int(os.environ.get("HTTP_CLIENT_MAX_CONNECTIONS", "100"))
+MAX_KEEPALIVE_CONNECTIONS = int(os.environ.get("HTTP_CLIENT_MAX_KEEPALIVE", "20"))
+KEEPALIVE_EXPIRY = float(os.environ.get("HTTP_CLIENT_KEEPALIVE_EXPIRY", "30"))
+CONNECT_TIMEOUT = float(os.environ.get("HTTP_CLIENT_CONNECT_TIMEOUT", "10"))
+READ_TIMEOUT = float(os.environ.get("HTTP_CLIENT_READ_TIMEOUT", "120"))
+POOL_TIMEOUT = float(os.environ.get("HTTP_CLIENT_POOL_TIMEOUT", "30"))
+# /api/openai takes its upstream from the client, so the pools kept must be bounded
+MAX_UPSTREAMS = int(os.environ.get("HTTP_CLIENT_MAX_UPSTREAMS", "16"))
+
+# upstreams the server itself chooses: Bedrock endpoints and GitHub, kept for the app lifetime
+_clients = {}
+# /api/openai upstreams, least recently used first
+_proxy_clients = OrderedDict()
+# open proxy streams per client; an evicted client is closed when its last one ends
+_open_streams = {}
+_evicted = set()
+_closing = set()
+
+
+def http2_available() -> bool:
+    return importlib.util.find_spec("h2") is not None
+
+
+def create_http_client(max_connections: int = MAX_CONNECTIONS,
+                       max_keepalive_connections: int = MAX_KEEPALIVE_CONNECTIONS,
+                       read_timeout: float = READ_TIMEOUT, pool_timeout: float = POOL_TIMEOUT,
+                       http2: bool = HTTP2_ENABLED) -> 'httpx.AsyncClient':
+    import httpx
+    if http2 and not http2_available():
+        print("HTTP/2 requested but the h2 package is not installed, using HTTP/1.1")
+        http2 = False
+    return httpx.AsyncClient(
+        http2=http2,
+        limits=httpx.Limits(max_connections=max_connections,
+                            max_keepalive_connections=max_keepalive_connections,
+                            keepalive_expiry=KEEPALIVE_EXPIRY),
+        timeout=httpx.Timeout(read_timeout, connect=CONNECT_TIMEOUT, pool=pool_timeout)
+    )
+
+
+def get_upstream_key(url: str) -> tuple:
+    parts = urlsplit(url)
+    return parts.scheme, parts.netloc
+
+
+def get_http_client(url: str, **options) -> 'httpx.AsyncClient':
+    """Return the app-lifetime client for the upstream of url, creating it on first use.
+
+    Each upstream (scheme, host, port) gets its own connection pool, so the limits
+    bound open sockets per upstream. Options only apply when the client is created.
+    Only for upstreams chosen by the server; use proxy_stream for client-supplied ones.
+    """
+    key = get_upstream_key(url)
+    client = _clients.get(key)
+    if client is None:
+        client = _clients[key] = create_http_client(**options)
+    return client
+
+
+def get_proxy_client(url: str) -> 'httpx.AsyncClient':
+    """Like get_http_client, but at most HTTP_CLIENT_MAX_UPSTREAMS clients are kept.
+
+    The least recently used one is dropped when another upstream needs a client,
+    and closed once its open streams have finished.
+    """
+    key = get_upstream_key(url)
+    client = _proxy_clients.get(key)
+    if client is not None:
+        _proxy_clients.move_to_end(key)
+        return client
+    client = _proxy_clients[key] = create_http_client()
+    while len(_proxy_clients) > max(1, MAX_UPSTREAMS):
+        _, evicted = _proxy_clients.popitem(last=False)
+        if evicted in _open_streams:
+            _evicted.add(evicted)
+        else:
+            close_later(evicted)
+    return client
+
+
+def close_later(client: 'httpx.AsyncClient'):
+    task = asyncio.get_running_loop().create_task(client.aclose())
+    _closing.add(task)
+    task.add_done_callback(_closing.discard)
+
+
+@asynccontextmanager
+async def proxy_stream(method: str, url: str, **kwargs):
+    """client.stream(method, url, **kwargs) on the proxy client of url, counted so an
+    evicted client is not closed under it."""
+    client = get_proxy_client(url)
+    _open_streams[client] = _open_streams.get(client, 0) + 1
+    try:
+        async with client.stream(method, url, **kwargs) as response:
+            yield response
+    finally:
+        _open_streams[client] -= 1
+        if not _open_streams[client]:
+            del _open_streams[client]
+            if client in _evicted:
+                _evicted.discard(client)
+                close_later(client)
+
+
+async def close_http_clients():
+    clients = list(_clients.values()) + list(_proxy_clients.values()) + list(_evicted)
+    _clients.clear()
+    _proxy_clients.clear()
+    _evicted.clear()
+    for client in clients:
+        await client.aclose()
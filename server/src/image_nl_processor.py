@@ -1,19 +1,37 @@
 import random
 import json
 import base64
+import hashlib
+import os
 from fastapi import HTTPException
 
+from attachments import hash_base64
+from cache import LRUCache, DiskCache
+from image_resize import resize_image, CLASSIFY_IMAGE_MAX_SIDE
+
+ANALYSIS_MODEL_ID = 'us.amazon.nova-lite-v1:0'
+ANALYSIS_CACHE_TTL = float(os.environ.get("ANALYSIS_CACHE_TTL", "86400"))
+ANALYSIS_CACHE_DB = os.environ.get("ANALYSIS_CACHE_DB", "")
+
+analysis_cache = LRUCache(max_entries=int(os.environ.get("ANALYSIS_CACHE_MAX_ENTRIES", "1024")),
+                          ttl=ANALYSIS_CACHE_TTL)
+analysis_disk_cache = DiskCache(ANALYSIS_CACHE_DB,
+                                max_entries=int(os.environ.get("ANALYSIS_CACHE_DB_MAX_ENTRIES", "10000")),
+                                ttl=ANALYSIS_CACHE_TTL) if ANALYSIS_CACHE_DB else None
+
 
 def get_native_request_with_ref_image(client, prompt, ref_images, width, height):
-    result = get_analyse_result(client, prompt, get_prompt())
+    result = get_analyse_result(client, prompt, get_prompt(), expect_json=True)
     try:
         result_objet = json.loads(result)
         seed = random.randint(0, 2147483647)
+        # only the generation tasks are resized; a background removal keeps the photo's resolution
+        image = ref_images[0]['source']['bytes']
         if result_objet['target_task_type'] == 'BACKGROUND_REMOVAL':
             return {
                 "taskType": "BACKGROUND_REMOVAL",
                 "backgroundRemovalParams": {
-                    "image": ref_images[0]['source']['bytes'],
+                    "image": image,
                 },
             }
         elif result_objet['target_task_type'] == 'TEXT_IMAGE':
@@ -35,7 +53,7 @@ def get_native_request_with_ref_image(client, prompt, ref_images, width, height)
                 "colorGuidedGenerationParams": {
                     "text": result_objet['optimized_prompt'],
                     "negativeText": "bad quality, low res",
-                    "referenceImage": ref_images[0]['source']['bytes'],
+                    "referenceImage": resize_image(image, width, height),
                     "colors": result_objet['colors']
                 },
                 "imageGenerationConfig": {
@@ -51,7 +69,7 @@ def get_native_request_with_ref_image(client, prompt, ref_images, width, height)
                 "imageVariationParams": {
                     "text": result_objet['optimized_prompt'],
                     "negativeText": "bad quality, low resolution, cartoon",
-                    "images": [ref_images[0]['source']['bytes']],
+                    "images": [resize_image(image, width, height)],
                     "similarityStrength": 0.7,
                 },
                 "imageGenerationConfig": {
@@ -67,7 +85,7 @@ def get_native_request_with_ref_image(client, prompt, ref_images, width, height)
                 "inPaintingParams": {
                     "text": result_objet['optimized_prompt'],
                     "negativeText": "bad quality, low res",
-                    "image": ref_images[0]['source']['bytes'],
+                    "image": resize_image(image, width, height),
                     "maskPrompt": result_objet['mask_prompt'],
                 },
                 "imageGenerationConfig": {
@@ -83,7 +101,47 @@ def get_native_request_with_ref_image(client, prompt, ref_images, width, height)
         raise HTTPException(status_code=400, detail=f"Error: image analyse failed, {error}")
 
 
-def get_analyse_result(client, prompt, global_prompt, image=None):
+def get_analysis_key(prompt, global_prompt, image=None) -> str:
+    image_digest = hash_base64(image) if image is not None else ''
+    key = '\0'.join((ANALYSIS_MODEL_ID, global_prompt, prompt, image_digest))
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+
+def get_analyse_result(client, prompt, global_prompt, image=None, expect_json=False):
+    """Run the nova-lite analysis, reusing the result of an identical earlier call.
+
+    Results are cached in memory and, when ANALYSIS_CACHE_DB is set, in SQLite so
+    they outlive the process. With expect_json a result that is not valid JSON is
+    returned but not cached, so a malformed answer is not replayed.
+    """
+    key = get_analysis_key(prompt, global_prompt, image)
+    result = analysis_cache.get(key)
+    if result is None and analysis_disk_cache is not None:
+        result = analysis_disk_cache.get(key)
+        if result is not None:
+            analysis_cache.put(key, result)
+    if result is not None:
+        return result
+    result = call_analysis_model(client, prompt, global_prompt, image)
+    if expect_json:
+        try:
+            json.loads(result)
+        except ValueError:
+            return result
+    analysis_cache.put(key, result)
+    if analysis_disk_cache is not None:
+        analysis_disk_cache.put(key, result)
+    return result
+
+
+def get_analysis_cache_stats() -> dict:
+    return {
+        "memory": analysis_cache.stats(),
+        "disk": analysis_disk_cache.stats() if analysis_disk_cache is not None else None
+    }
+
+
+def call_analysis_model(client, prompt, global_prompt, image=None):
     try:
         content = [{"text": prompt}]
         if image is not None:
@@ -102,7 +160,7 @@ def get_analyse_result(client, prompt, global_prompt, image=None):
             "system": [
                 {"text": global_prompt}
             ],
-            "modelId": 'us.amazon.nova-lite-v1:0'
+            "modelId": ANALYSIS_MODEL_ID
         }
         response = client.converse(**command)
         complete_res = ''
@@ -116,14 +174,14 @@ def get_analyse_result(client, prompt, global_prompt, image=None):
 
 
 def get_native_request_with_virtual_try_on(client, prompt, ref_images, width, height):
-    garment_image = ref_images[1]['source']['bytes']
+    garment_image = resize_image(ref_images[1]['source']['bytes'], width, height)
     garment_class = get_garment_class(client, prompt, garment_image)
     seed = random.randint(0, 2147483647)
 
     return {
         "taskType": "VIRTUAL_TRY_ON",
         "virtualTryOnParams": {
-            "sourceImage": ref_images[0]['source']['bytes'],
+            "sourceImage": resize_image(ref_images[0]['source']['bytes'], width, height),
             "referenceImage": garment_image,
             "returnMask": True,
             "maskType": "GARMENT",
@@ -139,8 +197,9 @@ def get_native_request_with_virtual_try_on(client, prompt, ref_images, width, he
 
 def get_garment_class(client, prompt, garment_image):
     system_prompt = get_garment_class_prompt()
+    thumbnail = resize_image(garment_image, CLASSIFY_IMAGE_MAX_SIDE, CLASSIFY_IMAGE_MAX_SIDE, cover=False)
     try:
-        result = get_analyse_result(client, prompt, system_prompt, garment_image)
+        result = get_analyse_result(client, prompt, system_prompt, thumbnail, expect_json=True)
         return json.loads(result).get('garment_class', 'FULL_BODY')
     except Exception as error:
         print(f'Error analyzing garment class: {error}')
@@ -0,0 +1,79 @@
+import base64
+import io
+import os
+
+from attachments import hash_base64
+from cache import LRUCache
+
+IMAGE_RESIZE = os.environ.get("IMAGE_RESIZE", "true").lower() == "true"
+IMAGE_RESIZE_QUALITY = int(os.environ.get("IMAGE_RESIZE_QUALITY", "90"))
+# the garment classifier only needs a thumbnail
+CLASSIFY_IMAGE_MAX_SIDE = int(os.environ.get("CLASSIFY_IMAGE_MAX_SIDE", "512"))
+
+# images that need no resizing are cached as "", which takes no bytes, so the entries are bounded too
+resized_cache = LRUCache(max_bytes=int(os.environ.get("IMAGE_RESIZE_CACHE_MAX_BYTES", str(64 * 1024 * 1024))),
+                         max_entries=int(os.environ.get("IMAGE_RESIZE_CACHE_MAX_ENTRIES", "1024")))
+_pillow_missing = False
+
+
+def get_pillow():
+    """Import Pillow on first use; without it images are passed through unchanged."""
+    global _pillow_missing
+    if _pillow_missing:
+        return None
+    try:
+        from PIL import Image, ImageOps
+    except ImportError:
+        print("Pillow is not installed, reference images are sent at their original size")
+        _pillow_missing = True
+        return None
+    return Image, ImageOps
+
+
+def resize_image(image: str, width: int, height: int, cover: bool = True) -> str:
+    """Downscale a base64 image and return it base64 encoded again.
+
+    With cover the image keeps its aspect ratio and is shrunk until it just covers
+    width x height, as image models need for a target of that size; otherwise it
+    is shrunk to fit inside the box. Images already small enough are returned
+    as they are, smaller ones are re-encoded as JPEG, or PNG when they have
+    transparency. Results are cached by content hash and size.
+    """
+    if not IMAGE_RESIZE or not image or width <= 0 or height <= 0:
+        return image
+    key = (hash_base64(image), width, height, cover)
+    result = resized_cache.get(key)
+    if result is None:
+        result = downscale(image, width, height, cover)
+        resized_cache.put(key, result)
+    # an empty result means the image is used as it is
+    return result or image
+
+
+def downscale(image: str, width: int, height: int, cover: bool) -> str:
+    pillow = get_pillow()
+    if pillow is None:
+        return ""
+    Image, ImageOps = pillow
+    try:
+        source = Image.open(io.BytesIO(base64.b64decode(image)))
+        # phones store the rotation in EXIF, which re-encoding would drop
+        ImageOps.exif_transpose(source, in_place=True)
+        scale = (max if cover else min)(width / source.width, height / source.height)
+        if scale >= 1:
+            return ""
+        size = (max(1, round(source.width * scale)), max(1, round(source.height * scale)))
+        resized = source.resize(size, Image.Resampling.LANCZOS, reducing_gap=3.0)
+        output = io.BytesIO()
+        if resized.mode in ("RGBA", "LA") or (resized.mode == "P" and "transparency" in resized.info):
+            resized.save(output, format="PNG", optimize=False)
+        else:
+            resized.convert("RGB").save(output, format="JPEG", quality=IMAGE_RESIZE_QUALITY)
+        return base64.b64encode(output.getvalue()).decode("ascii")
+    except Exception as error:
+        print(f"Error resizing reference image: {error}")
+        return ""
+
+
+def get_image_resize_stats() -> dict:
+    return resized_cache.stats()
@@ -1,30 +1,126 @@
-import base64
 from typing import List
-import uvicorn
 from fastapi import FastAPI, HTTPException, Depends, Request as FastAPIRequest
-from fastapi.responses import StreamingResponse, PlainTextResponse
-import boto3
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import StreamingResponse, PlainTextResponse, JSONResponse, Response
+from starlette.background import BackgroundTask
+import asyncio
+import base64
 import json
 import random
 import os
 import re
-from pydantic import BaseModel
-from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from typing import Annotated
-from urllib.request import urlopen, Request
 import time
-from image_nl_processor import get_native_request_with_ref_image, get_analyse_result, get_native_request_with_virtual_try_on
-import httpx
-
-app = FastAPI()
-security = HTTPBearer()
-
-auth_token = ''
-CACHE_DURATION = 120000
-cache = {
-    "latest_version": "",
-    "last_check": 0
-}
+from pydantic import BaseModel, ValidationError
+from typing import Annotated
+from contextlib import asynccontextmanager
+from starlette.concurrency import run_in_threadpool
+from aws_clients import get_client, prewarm_clients, get_client_stats
+from api_keys import verify_api_key, refresh_api_keys
+from bedrock_stream import (get_codec, get_bedrock_http_client, converse_stream_async, converse_stream_sync,
+                            coalesce_converse_events)
+from http_clients import proxy_stream, close_http_clients
+from attachments import decode_attachments, get_attachment_cache_stats
+from middleware import BodySizeLimitMiddleware, MetricsMiddleware, RequestDecompressionMiddleware
+from model_catalog import get_catalog, warm_catalogs, get_catalog_stats
+from version_check import get_latest_version
+from sse import SSEFramer, coalesce_sse
+from sts_credentials import get_client_credentials, get_sts_stats
+from sessions import Session, get_session_base, append_session, get_session_stats
+from request_body import parse_json_body
+from prompt_cache import add_cache_points
+from admission import admit, stream_with_retry
+from metrics import (StreamObserver, observe_converse_stream, record_upstream_error, model_requests, model_latency,
+                     add_collector, render_metrics)
+
+
+@asynccontextmanager
+async def lifespan(_: FastAPI):
+    prewarm_regions = [region for region in os.environ.get("PREWARM_REGIONS", "").split(",") if region]
+    key_task = None
+    if prewarm_regions:
+        # runs before the server accepts connections, i.e. inside the Lambda init phase
+        start = time.perf_counter()
+        services = tuple(os.environ.get("PREWARM_SERVICES", "bedrock-runtime").split(","))
+        await run_in_threadpool(prewarm_clients, prewarm_regions, services)
+        get_codec()
+        for region in prewarm_regions:
+            get_bedrock_http_client(get_client("bedrock-runtime", region).meta.endpoint_url)
+        print(f"Prewarmed clients for {prewarm_regions} in {(time.perf_counter() - start) * 1000:.0f}ms")
+        if os.environ.get("API_KEY_NAME"):
+            key_task = asyncio.create_task(refresh_api_keys())
+    warm_regions = [region for region in os.environ.get("MODEL_CATALOG_WARM_REGIONS", "").split(",") if region]
+    warm_task = asyncio.create_task(warm_catalogs(warm_regions)) if warm_regions else None
+    yield
+    for task in (warm_task, key_task):
+        if task is not None:
+            task.cancel()
+    await close_http_clients()
+
+
+MAX_BODY_BYTES = int(os.environ.get("MAX_REQUEST_BODY_BYTES", str(150 * 1024 * 1024)))
+
+app = FastAPI(lifespan=lifespan)
+# the size limit wraps decompression, so it counts the bytes on the wire and the
+# decompression middleware the bytes it produces
+app.add_middleware(RequestDecompressionMiddleware, max_body_bytes=MAX_BODY_BYTES)
+app.add_middleware(BodySizeLimitMiddleware, max_body_bytes=MAX_BODY_BYTES)
+app.add_middleware(MetricsMiddleware, routes=app.router.routes)
+
+
+def collect_cache_stats() -> list:
+    clients = get_client_stats()
+    attachments = get_attachment_cache_stats()
+    sts = get_sts_stats()
+    sessions = get_session_stats()
+    return [
+        ("swiftchat_boto_client_lookups_total", "counter", "boto3 client registry lookups.",
+         [({"result": "hit"}, clients["hits"]), ({"result": "miss"}, clients["misses"])]),
+        ("swiftchat_attachment_cache_lookups_total", "counter", "Decoded attachment cache lookups.",
+         [({"result": "hit"}, attachments["hits"]), ({"result": "miss"}, attachments["misses"])]),
+        ("swiftchat_attachment_cache_bytes", "gauge", "Bytes held by the decoded attachment cache.",
+         [({}, attachments["bytes"])]),
+        ("swiftchat_attachment_cache_evictions_total", "counter", "Attachments evicted from the cache.",
+         [({}, attachments["evictions"])]),
+        ("swiftchat_sts_credential_requests_total", "counter", "/api/token credential lookups.",
+         [({"result": "hit"}, sts["hits"]), ({"result": "miss"}, sts["requests"] - sts["hits"])]),
+        ("swiftchat_sts_refresh_failures_total", "counter", "Failed assume_role refreshes.",
+         [({}, sts["failures"])]),
+        ("swiftchat_session_lookups_total", "counter", "Conversation session lookups of delta requests.",
+         [({"result": "hit"}, sessions["hits"]), ({"result": "miss"}, sessions["misses"])]),
+        ("swiftchat_sessions", "gauge", "Conversation sessions held in memory.", [({}, sessions["entries"])]),
+        ("swiftchat_session_bytes", "gauge", "Approximate size of the stored session histories.",
+         [({}, sessions["bytes"])]),
+        ("swiftchat_model_catalog_age_seconds", "gauge", "Age of the cached model list per region.",
+         [({"region": region}, entry["age"]) for region, entry in get_catalog_stats().items()]),
+    ]
+
+
+def collect_analysis_cache_stats() -> list:
+    from image_nl_processor import get_analysis_cache_stats
+    from image_resize import get_image_resize_stats
+    stats = get_analysis_cache_stats()
+    resized = get_image_resize_stats()
+    tiers = [("memory", stats["memory"])] + ([("disk", stats["disk"])] if stats["disk"] else [])
+    return [
+        ("swiftchat_analysis_cache_lookups_total", "counter", "Cached nova-lite image analysis lookups.",
+         [({"tier": tier, "result": result}, values[key]) for tier, values in tiers
+          for result, key in (("hit", "hits"), ("miss", "misses"))]),
+        ("swiftchat_analysis_cache_entries", "gauge", "Image analysis results held per cache tier.",
+         [({"tier": tier}, values["entries"]) for tier, values in tiers]),
+        ("swiftchat_analysis_cache_evictions_total", "counter", "Image analysis results evicted from memory.",
+         [({}, stats["memory"]["evictions"])]),
+        ("swiftchat_image_resize_cache_lookups_total", "counter", "Downscaled reference image cache lookups.",
+         [({"result": "hit"}, resized["hits"]), ({"result": "miss"}, resized["misses"])]),
+        ("swiftchat_image_resize_cache_bytes", "gauge", "Bytes held by the downscaled reference image cache.",
+         [({}, resized["bytes"])]),
+    ]
+
+
+add_collector(collect_cache_stats)
+add_collector(collect_analysis_cache_stats)
+
+STREAM_MODE = os.environ.get("BEDROCK_STREAM_MODE", "async")
+FAST_BODY_PARSING = os.environ.get("CONVERSE_FAST_PARSE", "true").lower() == "true"
 
 
 class ImageRequest(BaseModel):
@@ -34,14 +130,23 @@ class ImageRequest(BaseModel):
     region: str
     width: int
     height: int
+    # batch mode: generate count images with each of modelIds (or modelId)
+    modelIds: List[str] | None = None
+    count: int = 1
 
 
-class ConverseRequest(BaseModel):
-    messages: List[dict] = []
+class ConverseEnvelope(BaseModel):
     modelId: str
     enableThinking: bool | None = None
     region: str
     system: List[dict] | None = None
+    sessionId: str | None = None
+    baseLength: int = 0
+    baseDigest: str | None = None
+
+
+class ConverseRequest(ConverseEnvelope):
+    messages: List[dict] = []
 
 
 class StreamOptions(BaseModel):
@@ -68,40 +173,53 @@ class UpgradeRequest(BaseModel):
     version: str
 
 
-def get_api_key_from_ssm(use_cache_token: bool):
-    global auth_token
-    if use_cache_token and auth_token != '':
-        return auth_token
-    ssm_client = boto3.client('ssm')
-    api_key_name = os.environ['API_KEY_NAME']
-    try:
-        response = ssm_client.get_parameter(
-            Name=api_key_name,
-            WithDecryption=True
-        )
-        auth_token = response['Parameter']['Value']
-        return auth_token
-    except Exception as error:
-        raise HTTPException(status_code=401,
-                            detail=f"Error: Please create your API Key in Parameter Store, {str(error)}")
+CONVERSE_OPENAPI = {
+    "requestBody": {
+        "content": {"application/json": {"schema": ConverseRequest.model_json_schema()}},
+        "required": True
+    }
+}
+
 
+def body_error(error_type: str, loc: tuple, msg: str, **extra) -> RequestValidationError:
+    return RequestValidationError([{"type": error_type, "loc": ("body", *loc), "msg": msg, **extra}])
 
-def verify_api_key(credentials: Annotated[HTTPAuthorizationCredentials, Depends(security)],
-                   use_cache_token: bool = True):
-    if credentials.credentials != get_api_key_from_ssm(use_cache_token):
-        raise HTTPException(status_code=401, detail="Invalid API Key")
-    return credentials.credentials
 
+async def read_converse_request(raw_request: FastAPIRequest) -> ConverseRequest:
+    """Parse and validate a converse body the way FastAPI would for ConverseRequest, but faster.
 
-def verify_and_refresh_token(credentials: Annotated[HTTPAuthorizationCredentials, Depends(security)]):
-    return verify_api_key(credentials, use_cache_token=False)
+    Base64 attachment strings stay memoryview slices of the body and the rest is
+    parsed with orjson. Only the envelope fields go through pydantic; messages
+    just have to be a list of objects, which Bedrock validates anyway.
+    """
+    body = await raw_request.body()
+    try:
+        data = parse_json_body(body) if FAST_BODY_PARSING else json.loads(body)
+    except ValueError as error:
+        raise body_error("json_invalid", (getattr(error, "pos", 0),), "JSON decode error",
+                         input={}, ctx={"error": getattr(error, "msg", str(error))})
+    if not isinstance(data, dict):
+        raise body_error("model_attributes_type", (), "Input should be a valid dictionary or object", input=data)
+    if not FAST_BODY_PARSING:
+        try:
+            return ConverseRequest.model_validate(data)
+        except ValidationError as error:
+            raise RequestValidationError([{**item, "loc": ("body", *item["loc"])} for item in error.errors()])
+    messages = data.pop("messages", [])
+    if not isinstance(messages, list) or not all(isinstance(message, dict) for message in messages):
+        raise body_error("list_type", ("messages",), "Input should be a valid list of objects", input=None)
+    try:
+        envelope = ConverseEnvelope.model_validate(data)
+    except ValidationError as error:
+        raise RequestValidationError([{**item, "loc": ("body", *item["loc"])} for item in error.errors()])
+    return ConverseRequest.model_construct(messages=messages, **dict(envelope))
 
 
-async def create_bedrock_command(request: ConverseRequest) -> tuple[boto3.client, dict]:
+async def create_bedrock_command(request: ConverseRequest) -> tuple[object, dict, Session | None]:
     model_id = request.modelId
     region = request.region
 
-    client = boto3.client("bedrock-runtime", region_name=region)
+    client = get_client("bedrock-runtime", region)
 
     max_tokens = 4096
     if model_id.startswith('meta.llama'):
@@ -111,22 +229,20 @@ async def create_bedrock_command(request: ConverseRequest) -> tuple[boto3.client
     if 'claude-3-7-sonnet' in model_id or 'claude-sonnet-4' in model_id:
         max_tokens = 64000
 
-    for message in request.messages:
-        if message["role"] == "user":
-            for content in message["content"]:
-                if 'image' in content:
-                    image_bytes = base64.b64decode(content['image']['source']['bytes'])
-                    content['image']['source']['bytes'] = image_bytes
-                if 'video' in content:
-                    video_bytes = base64.b64decode(content['video']['source']['bytes'])
-                    content['video']['source']['bytes'] = video_bytes
-                if 'document' in content:
-                    document_bytes = base64.b64decode(content['document']['source']['bytes'])
-                    content['document']['source']['bytes'] = document_bytes
+    # with a sessionId the client only sends the messages after the first baseLength
+    # ones, the rest come from the session store already decoded
+    session = get_session_base(request.sessionId, request.baseLength, request.baseDigest) \
+        if request.sessionId else None
+    await decode_attachments(request.messages)
+    messages = request.messages
+    if request.sessionId:
+        session = await append_session(request.sessionId, session, request.baseLength, request.messages)
+        messages = session.messages
+    system, messages = add_cache_points(model_id, request.system, messages)
 
     command = {
         "inferenceConfig": {"maxTokens": max_tokens},
-        "messages": request.messages,
+        "messages": messages,
         "modelId": model_id
     }
 
@@ -138,54 +254,169 @@ async def create_bedrock_command(request: ConverseRequest) -> tuple[boto3.client
             }
         }
 
-    if request.system is not None:
-        command["system"] = request.system
+    if system is not None:
+        command["system"] = system
+
+    return client, command, session
+
 
-    return client, command
+def get_session_headers(session: Session | None) -> dict | None:
+    if session is None:
+        return None
+    # the client sends the digest back as baseDigest with the next delta
+    return {"X-Session-Length": str(len(session.messages)), "X-Session-Digest": session.digests[-1]}
 
 
-@app.post("/api/converse/v3")
-async def converse_v3(request: ConverseRequest,
+def open_converse_stream(endpoint: str, request: ConverseRequest, client, command: dict):
+    """Stream the command, retrying throttled calls until their first event, possibly
+    in the fallback region of a cross-region profile."""
+    if STREAM_MODE != "async":
+        # botocore retries throttled calls itself
+        return converse_stream_sync(client, command)
+    return stream_with_retry(
+        lambda region: converse_stream_async(get_client("bedrock-runtime", region), command),
+        endpoint, request.modelId, request.region)
+
+
+@app.post("/api/converse/v3", openapi_extra=CONVERSE_OPENAPI)
+async def converse_v3(raw_request: FastAPIRequest,
                       _: Annotated[str, Depends(verify_api_key)]):
+    request = await read_converse_request(raw_request)
     try:
-        client, command = await create_bedrock_command(request)
-
-        def event_generator():
+        client, command, session = await create_bedrock_command(request)
+        # holds one of the model's concurrency slots until the response is finished
+        permit = await admit(request.modelId, request.region)
+
+        async def event_generator():
+            # a client disconnect cancels this generator, which closes the upstream stream
+            observer = StreamObserver("converse_v3", request.modelId, request.region)
+            events = observe_converse_stream(open_converse_stream("converse_v3", request, client, command), observer)
             try:
-                response = client.converse_stream(**command)
-                for item in response['stream']:
-                    yield json.dumps(item) + '\n\n'
+                async for data in coalesce_converse_events(events, b'\n\n'):
+                    yield data
             except Exception as err:
                 yield f"Error: {str(err)}"
+            finally:
+                permit.release()
 
-        return StreamingResponse(event_generator(), media_type="text/event-stream")
+        return StreamingResponse(event_generator(), media_type="text/event-stream",
+                                 headers=get_session_headers(session),
+                                 background=BackgroundTask(permit.release))
 
+    except HTTPException:
+        raise
     except Exception as error:
         return PlainTextResponse(f"Error: {str(error)}", status_code=500)
 
 
-@app.post("/api/converse/v2")
-async def converse_v2(request: ConverseRequest,
+@app.post("/api/converse/v2", openapi_extra=CONVERSE_OPENAPI)
+async def converse_v2(raw_request: FastAPIRequest,
                       _: Annotated[str, Depends(verify_api_key)]):
+    request = await read_converse_request(raw_request)
     try:
-        client, command = await create_bedrock_command(request)
+        client, command, session = await create_bedrock_command(request)
+        # holds one of the model's concurrency slots until the response is finished
+        permit = await admit(request.modelId, request.region)
 
-        def event_generator():
+        async def event_generator():
+            observer = StreamObserver("converse_v2", request.modelId, request.region)
+            events = observe_converse_stream(open_converse_stream("converse_v2", request, client, command), observer)
             try:
-                response = client.converse_stream(**command)
-                for item in response['stream']:
+                async for item in events:
                     yield json.dumps(item)
             except Exception as err:
                 yield f"Error: {str(err)}"
+            finally:
+                permit.release()
 
-        return StreamingResponse(event_generator(), media_type="text/event-stream")
+        return StreamingResponse(event_generator(), media_type="text/event-stream",
+                                 headers=get_session_headers(session),
+                                 background=BackgroundTask(permit.release))
 
+    except HTTPException:
+        raise
     except Exception as error:
         return PlainTextResponse(f"Error: {str(error)}", status_code=500)
 
 
+IMAGE_BATCH_MAX_IMAGES = int(os.environ.get("IMAGE_BATCH_MAX_IMAGES", "8"))
+IMAGE_BATCH_CONCURRENCY = int(os.environ.get("IMAGE_BATCH_CONCURRENCY", "4"))
+IMAGE_MEDIA_TYPES = ((b"\x89PNG", "image/png"), (b"\xff\xd8", "image/jpeg"), (b"RIFF", "image/webp"))
+
+
+def accepts_binary_image(raw_request: FastAPIRequest) -> bool:
+    accept = raw_request.headers.get("accept", "")
+    return any(item.split(";")[0].strip() in ("image/*", "image/png", "image/jpeg") for item in accept.split(","))
+
+
+def get_image_media_type(data: bytes) -> str:
+    for magic, media_type in IMAGE_MEDIA_TYPES:
+        if data.startswith(magic):
+            return media_type
+    return "application/octet-stream"
+
+
+def needs_english_prompt(request: ImageRequest, model_id: str) -> bool:
+    return request.refImages is None or model_id.startswith("stability.")
+
+
+async def stream_image_batch(request: ImageRequest, models: list, client):
+    """Generate request.count images with each model, at most IMAGE_BATCH_CONCURRENCY at
+    a time, and stream one JSON line per image as soon as it is done.
+
+    The prompt translation and each model's request, including the task analysis,
+    are built once and shared by its images, which only differ in their seed. The
+    translation runs before the response starts, so its failure is a 400 as for
+    a single image.
+    """
+    english_prompt = None
+    if contains_chinese(request.prompt) and any(needs_english_prompt(request, model) for model in models):
+        english_prompt = await run_in_threadpool(get_english_prompt, client, request.prompt)
+
+    async def event_generator():
+        semaphore = asyncio.Semaphore(IMAGE_BATCH_CONCURRENCY)
+        builds = {}
+
+        def build(model_id: str) -> asyncio.Future:
+            if model_id not in builds:
+                prompt = english_prompt if english_prompt and needs_english_prompt(request, model_id) \
+                    else request.prompt
+                builds[model_id] = asyncio.ensure_future(run_in_threadpool(
+                    build_image_request, client, model_id, prompt, request.refImages, request.width,
+                    request.height))
+            return builds[model_id]
+
+        async def generate(index: int, model_id: str) -> dict:
+            async with semaphore:
+                start = time.perf_counter()
+                try:
+                    # shielded, so a cancelled image does not cancel the build its siblings wait for
+                    native_request = await asyncio.shield(build(model_id))
+                except Exception as error:
+                    result = get_image_error(client, model_id, error)
+                else:
+                    result = await run_in_threadpool(invoke_image_model, client, model_id,
+                                                     with_new_seed(native_request))
+                model_latency.observe("image", model_id, request.region, value=time.perf_counter() - start)
+                model_requests.inc("image", model_id, request.region, "error" if "error" in result else "ok")
+            return {"index": index, "modelId": model_id, **result}
+
+        tasks = [asyncio.ensure_future(generate(index, model_id))
+                 for index, model_id in enumerate(model for model in models for _ in range(request.count))]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield json.dumps(await next_done) + "\n"
+        finally:
+            # the client went away: images still waiting for a slot are not generated
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(event_generator(), media_type="application/x-ndjson")
+
+
 @app.post("/api/image")
 async def gen_image(request: ImageRequest,
+                    raw_request: FastAPIRequest,
                     _: Annotated[str, Depends(verify_api_key)]):
     model_id = request.modelId
     prompt = request.prompt
@@ -193,11 +424,25 @@ async def gen_image(request: ImageRequest,
     width = request.width
     height = request.height
     region = request.region
-    client = boto3.client("bedrock-runtime",
-                          region_name=region)
-    if (ref_images is None or model_id.startswith("stability.")) and contains_chinese(prompt):
-        prompt = get_english_prompt(client, prompt)
-    return get_image(client, model_id, prompt, ref_images, width, height)
+    client = get_client("bedrock-runtime", region)
+    if request.modelIds or request.count != 1:
+        models = request.modelIds or [model_id]
+        if request.count < 1 or len(models) * request.count > IMAGE_BATCH_MAX_IMAGES:
+            raise HTTPException(status_code=400,
+                                detail=f"Error: a batch may generate 1 to {IMAGE_BATCH_MAX_IMAGES} images")
+        return await stream_image_batch(request, models, client)
+    # the nova-lite analysis and image model calls block for seconds, keep them off the event loop
+    start = time.perf_counter()
+    if needs_english_prompt(request, model_id) and contains_chinese(prompt):
+        prompt = await run_in_threadpool(get_english_prompt, client, prompt)
+    result = await run_in_threadpool(get_image, client, model_id, prompt, ref_images, width, height)
+    model_latency.observe("image", model_id, region, value=time.perf_counter() - start)
+    model_requests.inc("image", model_id, region, "error" if "error" in result else "ok")
+    if "image" in result and accepts_binary_image(raw_request):
+        # raw bytes are a quarter smaller than base64 and need no decoding on the device
+        data = base64.b64decode(result["image"])
+        return Response(data, media_type=get_image_media_type(data))
+    return result
 
 
 @app.post("/api/token")
@@ -208,14 +453,7 @@ async def get_token(request: TokenRequest,
         client_role_arn = os.environ.get('CLIENT_ROLE_ARN')
         if not client_role_arn:
             return {"error": "CLIENT_ROLE_ARN environment variable not set"}
-        sts_client = boto3.client('sts', region_name=region)
-        session_name = f"SwiftChatClient-{int(time.time())}"
-        response = sts_client.assume_role(
-            RoleArn=client_role_arn,
-            RoleSessionName=session_name,
-            DurationSeconds=3600
-        )
-        credentials = response['Credentials']
+        credentials = await get_client_credentials(region, client_role_arn)
         return {
             "accessKeyId": credentials['AccessKeyId'],
             "secretAccessKey": credentials['SecretAccessKey'],
@@ -229,45 +467,14 @@ async def get_token(request: TokenRequest,
 
 @app.post("/api/models")
 async def get_models(request: ModelsRequest,
+                     raw_request: FastAPIRequest,
                      _: Annotated[str, Depends(verify_api_key)]):
-    region = request.region
-    client = boto3.client("bedrock",
-                          region_name=region)
-
     try:
-        response = client.list_foundation_models()
-        if response.get("modelSummaries"):
-            model_names = set()
-            text_model = []
-            image_model = []
-            for model in response["modelSummaries"]:
-                need_cross_region = "INFERENCE_PROFILE" in model["inferenceTypesSupported"]
-                if (model["modelLifecycle"]["status"] == "ACTIVE"
-                        and ("ON_DEMAND" in model["inferenceTypesSupported"] or need_cross_region)
-                        and not model["modelId"].endswith("k")
-                        and model["modelName"] not in model_names):
-                    if ("TEXT" in model.get("outputModalities", []) and
-                            model.get("responseStreamingSupported")):
-                        if need_cross_region:
-                            region_prefix = region.split("-")[0]
-                            if region_prefix == 'ap':
-                                region_prefix = 'apac'
-                            model_id = region_prefix + "." + model["modelId"]
-                        else:
-                            model_id = model["modelId"]
-                        text_model.append({
-                            "modelId": model_id,
-                            "modelName": model["modelName"]
-                        })
-                    elif "IMAGE" in model.get("outputModalities", []):
-                        image_model.append({
-                            "modelId": model["modelId"],
-                            "modelName": model["modelName"]
-                        })
-                    model_names.add(model["modelName"])
-            return {"textModel": text_model, "imageModel": image_model}
-        else:
-            return []
+        catalog = await get_catalog(request.region)
+        headers = {"ETag": catalog["etag"]}
+        if raw_request.headers.get("If-None-Match") == catalog["etag"]:
+            return Response(status_code=304, headers=headers)
+        return JSONResponse(catalog["models"], headers=headers)
     except Exception as e:
         print(f"bedrock error: {e}")
         return {"error": str(e)}
@@ -275,8 +482,8 @@ async def get_models(request: ModelsRequest,
 
 @app.post("/api/upgrade")
 async def upgrade(request: UpgradeRequest,
-                  _: Annotated[str, Depends(verify_and_refresh_token)]):
-    new_version = get_latest_version()
+                  _: Annotated[str, Depends(verify_api_key)]):
+    new_version = await get_latest_version()
     total_number = calculate_version_total(request.version)
     need_upgrade = False
     url = ''
@@ -291,6 +498,11 @@ async def upgrade(request: UpgradeRequest,
     return {"needUpgrade": need_upgrade, "version": new_version, "url": url}
 
 
+@app.get("/metrics")
+async def get_metrics(_: Annotated[str, Depends(verify_api_key)]):
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+
 @app.post("/api/openai")
 async def converse_openai(request: GPTRequest, raw_request: FastAPIRequest):
     auth_header = raw_request.headers.get("Authorization")
@@ -304,27 +516,39 @@ async def converse_openai(request: GPTRequest, raw_request: FastAPIRequest):
     x_title = raw_request.headers.get("X-Title")
 
     async def event_generator():
-        async with httpx.AsyncClient() as client:
-            try:
-                async with client.stream(
-                        "POST",
-                        request_url,
-                        json=request.model_dump(),
-                        headers={
-                            "Authorization": f"Bearer {openai_api_key}",
-                            "Content-Type": "application/json",
-                            "Accept": "text/event-stream",
-                            **({"HTTP-Referer": http_referer} if http_referer else {}),
-                            **({"X-Title": x_title} if x_title else {})
-                        }
-                ) as response:
-                    async for line in response.aiter_bytes():
-                        if line:
-                            yield line
-
-            except Exception as err:
-                print("error:", err)
-                yield f"Error: {str(err)}".encode('utf-8')
+        observer = StreamObserver("openai", request.model)
+        framer = SSEFramer()
+        try:
+            async with proxy_stream(
+                    "POST",
+                    request_url,
+                    json=request.model_dump(),
+                    headers={
+                        "Authorization": f"Bearer {openai_api_key}",
+                        "Content-Type": "application/json",
+                        "Accept": "text/event-stream",
+                        **({"HTTP-Referer": http_referer} if http_referer else {}),
+                        **({"X-Title": x_title} if x_title else {})
+                    }
+            ) as response:
+                if response.status_code >= 400:
+                    observer.on_error(f"HTTP {response.status_code}", str(response.status_code))
+                async for events in coalesce_sse(response.aiter_bytes(), framer):
+                    observer.on_event()
+                    yield events
+            usage = framer.usage or {}
+            observer.on_usage(usage.get("prompt_tokens"), usage.get("completion_tokens"))
+
+        except (GeneratorExit, asyncio.CancelledError):
+            # the client went away; leaving the block above closed the upstream connection
+            observer.finish("cancelled")
+            raise
+        except Exception as err:
+            print("error:", err)
+            observer.on_error(err)
+            yield f"Error: {str(err)}".encode('utf-8')
+        finally:
+            observer.finish()
 
     return StreamingResponse(event_generator(), media_type="text/event-stream")
 
@@ -337,74 +561,83 @@ def calculate_version_total(version: str) -> int:
     return total_number
 
 
-def get_latest_version() -> str:
-    timestamp = int(time.time() * 1000)
-    if cache["last_check"] > 0 and timestamp - cache["last_check"] < CACHE_DURATION:
-        return cache["latest_version"]
-    req = Request(
-        f"https://api.github.com/repos/aws-samples/swift-chat/tags",
-        headers={
-            'User-Agent': 'Mozilla/5.0'
-        }
-    )
+def get_image(client, model_id, prompt, ref_image, width, height):
     try:
-        with urlopen(req) as response:
-            content = response.read().decode('utf-8')
-            latest_version = json.loads(content)[0]['name']
-            cache["latest_version"] = latest_version
-            cache["last_check"] = timestamp
-            return json.loads(content)[0]['name']
+        native_request = build_image_request(client, model_id, prompt, ref_image, width, height)
     except Exception as error:
-        print(f"Error occurred when get github tag: {error}")
-    return '0.0.0'
+        return get_image_error(client, model_id, error)
+    return invoke_image_model(client, model_id, native_request)
 
 
-def get_image(client, model_id, prompt, ref_image, width, height):
-    try:
-        seed = random.randint(0, 2147483647)
-        native_request = {}
-        if model_id.startswith("amazon"):
-            if ref_image is None:
-                native_request = {
-                    "taskType": "TEXT_IMAGE",
-                    "textToImageParams": {"text": prompt},
-                    "imageGenerationConfig": {
-                        "numberOfImages": 1,
-                        "quality": "standard",
-                        "cfgScale": 8.0,
-                        "height": height,
-                        "width": width,
-                        "seed": seed,
-                    },
-                }
-            elif len(ref_image) == 2:
-                native_request = get_native_request_with_virtual_try_on(client, prompt, ref_image, width, height)
-            else:
-                native_request = get_native_request_with_ref_image(client, prompt, ref_image, width, height)
-        elif model_id.startswith("stability."):
+def build_image_request(client, model_id, prompt, ref_image, width, height) -> dict:
+    from image_nl_processor import get_native_request_with_ref_image, get_native_request_with_virtual_try_on
+    from image_resize import resize_image
+    seed = random.randint(0, 2147483647)
+    native_request = {}
+    if model_id.startswith("amazon"):
+        if ref_image is None:
             native_request = {
-                "prompt": prompt,
-                "output_format": "jpeg",
-                "mode": "text-to-image",
+                "taskType": "TEXT_IMAGE",
+                "textToImageParams": {"text": prompt},
+                "imageGenerationConfig": {
+                    "numberOfImages": 1,
+                    "quality": "standard",
+                    "cfgScale": 8.0,
+                    "height": height,
+                    "width": width,
+                    "seed": seed,
+                },
             }
-            if ref_image:
-                native_request['mode'] = 'image-to-image'
-                native_request['image'] = ref_image[0]['source']['bytes']
-                native_request['strength'] = 0.5
-            else:
-                native_request['aspect_ratio'] = "1:1"
-        request = json.dumps(native_request)
-        response = client.invoke_model(modelId=model_id, body=request)
+        elif len(ref_image) == 2:
+            native_request = get_native_request_with_virtual_try_on(client, prompt, ref_image, width, height)
+        else:
+            native_request = get_native_request_with_ref_image(client, prompt, ref_image, width, height)
+    elif model_id.startswith("stability."):
+        native_request = {
+            "prompt": prompt,
+            "output_format": "jpeg",
+            "mode": "text-to-image",
+        }
+        if ref_image:
+            native_request['mode'] = 'image-to-image'
+            native_request['image'] = resize_image(ref_image[0]['source']['bytes'], width, height)
+            native_request['strength'] = 0.5
+        else:
+            native_request['aspect_ratio'] = "1:1"
+    return native_request
+
+
+def invoke_image_model(client, model_id, native_request: dict) -> dict:
+    try:
+        response = client.invoke_model(modelId=model_id, body=json.dumps(native_request))
         model_response = json.loads(response["body"].read())
         base64_image_data = model_response["images"][0]
         return {"image": base64_image_data}
     except Exception as error:
-        error_msg = str(error)
-        print(f"Error occurred: {error_msg}")
-        return {"error": error_msg}
+        return get_image_error(client, model_id, error)
+
+
+def get_image_error(client, model_id, error) -> dict:
+    error_msg = str(error)
+    print(f"Error occurred: {error_msg}")
+    record_upstream_error("image", model_id, client.meta.region_name, error)
+    return {"error": error_msg}
+
+
+def with_new_seed(native_request: dict) -> dict:
+    """Copy of native_request with a fresh seed, so batch variants differ."""
+    seed = random.randint(0, 2147483647)
+    if "imageGenerationConfig" in native_request:
+        return {**native_request,
+                "imageGenerationConfig": {**native_request["imageGenerationConfig"], "seed": seed}}
+    if "taskType" in native_request:
+        # background removal takes no seed and always gives the same image
+        return native_request
+    return {**native_request, "seed": seed}
 
 
 def get_english_prompt(client, prompt):
+    from image_nl_processor import get_analyse_result
     global_prompt = f"Translate to English image prompt, output only English translation."
     return get_analyse_result(client, prompt, global_prompt)
 
@@ -415,6 +648,35 @@ def contains_chinese(text):
     return match is not None
 
 
+def get_cpu_count() -> int:
+    """CPUs this process may use, honouring the cgroup v2 quota of the container."""
+    count = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as file:
+            quota, period = file.read().split()
+        if quota != "max":
+            count = min(count, max(1, -(-int(quota) // int(period))))
+    except (OSError, ValueError):
+        pass
+    return count
+
+
+def get_worker_count() -> int:
+    workers = os.environ.get("WORKERS", "1")
+    return get_cpu_count() if workers == "auto" else max(1, int(workers))
+
+
 if __name__ == "__main__":
-    print("Starting webserver...")
-    uvicorn.run(app, host="0.0.0.0", port=int(os.environ.get("PORT", "8080")))
+    import uvicorn
+    workers = get_worker_count()
+    graceful_timeout = os.environ.get("GRACEFUL_SHUTDOWN_TIMEOUT")
+    print(f"Starting webserver with {workers} worker(s)...")
+    # workers are spawned processes that already ran this file as __main__, so
+    # "__main__:app" reuses that module instead of importing main.py a second time
+    uvicorn.run(app if workers == 1 else "__main__:app",
+                host="0.0.0.0",
+                port=int(os.environ.get("PORT", "8080")),
+                workers=workers,
+                loop=os.environ.get("UVICORN_LOOP", "auto"),
+                http=os.environ.get("UVICORN_HTTP", "auto"),
+                timeout_graceful_shutdown=int(graceful_timeout) if graceful_timeout else None)
@@ -0,0 +1,287 @@
+import asyncio
+import bisect
+import os
+import threading
+import time
+
+METRICS_MAX_SERIES = int(os.environ.get("METRICS_MAX_SERIES", "500"))
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+TOKENS_PER_SECOND_BUCKETS = (5, 10, 20, 40, 60, 80, 100, 150, 200, 300, 500)
+THROTTLE_CODES = {"ThrottlingException", "TooManyRequestsException", "ServiceQuotaExceededException",
+                  "ModelNotReadyException", "429"}
+
+_metrics = []
+_collectors = []
+_lock = threading.Lock()
+
+
+class Metric:
+    """A Prometheus metric family whose series are keyed by a tuple of label values.
+
+    Recording is a few dict operations under one uncontended lock, so updates from
+    the threadpool are not lost. Once a family holds METRICS_MAX_SERIES series, new
+    label combinations are folded into a single "other" series, so client-supplied
+    model ids cannot grow it without bound.
+    """
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labels: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.series = {}
+        _metrics.append(self)
+
+    def key(self, values: tuple) -> tuple:
+        if values in self.series or len(self.series) < METRICS_MAX_SERIES:
+            return values
+        return ("other",) * len(values)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for values, value in list(self.series.items()):
+            lines.append(f"{self.name}{format_labels(self.labels, values)} {format_value(value)}")
+        return lines
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, *values, amount: float = 1):
+        with _lock:
+            key = self.key(values)
+            self.series[key] = self.series.get(key, 0) + amount
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, *values, amount: float = 1):
+        self.inc(*values, amount=-amount)
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = buckets
+
+    def observe(self, *values, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with _lock:
+            key = self.key(values)
+            series = self.series.get(key)
+            if series is None:
+                # per-bucket counts, made cumulative when rendered, then sum and count
+                series = self.series[key] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        names = self.labels + ("le",)
+        for values, series in list(self.series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), series):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{format_labels(names, values + (bound,))} {cumulative}")
+            lines.append(f"{self.name}_sum{format_labels(self.labels, values)} {format_value(series[-2])}")
+            lines.append(f"{self.name}_count{format_labels(self.labels, values)} {series[-1]}")
+        return lines
+
+
+def format_labels(names: tuple, values: tuple) -> str:
+    if not names:
+        return ""
+    pairs = []
+    for name, value in zip(names, values):
+        value = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+def format_value(value: float) -> str:
+    if isinstance(value, float) and not value.is_integer():
+        return repr(round(value, 6))
+    return str(int(value))
+
+
+def add_collector(collector):
+    """Register a function returning (name, kind, documentation, [(labels, value)]) tuples,
+    called on every scrape for values that live elsewhere, such as cache stats."""
+    _collectors.append(collector)
+
+
+def render_metrics() -> str:
+    lines = []
+    for metric in _metrics:
+        lines.extend(metric.render())
+    for collector in _collectors:
+        for name, kind, documentation, samples in collector():
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                lines.append(f"{name}{format_labels(tuple(labels), tuple(labels.values()))} {format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+http_requests = Counter("swiftchat_http_requests_total", "HTTP requests by route and status.",
+                        ("path", "method", "status"))
+http_latency = Histogram("swiftchat_http_request_duration_seconds",
+                         "Time from receiving a request to sending the response headers.", ("path",))
+model_requests = Counter("swiftchat_model_requests_total", "Model calls by outcome.",
+                         ("endpoint", "model", "region", "status"))
+model_latency = Histogram("swiftchat_model_latency_seconds",
+                          "Duration of non-streaming model calls such as image generation.",
+                          ("endpoint", "model", "region"))
+first_event_latency = Histogram("swiftchat_time_to_first_event_seconds",
+                                "Time from sending a model request to its first stream event.",
+                                ("endpoint", "model", "region"))
+stream_duration = Histogram("swiftchat_stream_duration_seconds", "Duration of model response streams.",
+                            ("endpoint", "model", "region"))
+tokens = Counter("swiftchat_tokens_total", "Tokens reported in stream usage events.",
+                 ("endpoint", "model", "region", "type"))
+output_tokens_per_second = Histogram("swiftchat_output_tokens_per_second",
+                                     "Output tokens per second after the first stream event.",
+                                     ("endpoint", "model", "region"), TOKENS_PER_SECOND_BUCKETS)
+inflight_streams = Gauge("swiftchat_inflight_streams", "Response streams currently open.", ("endpoint",))
+upstream_errors = Counter("swiftchat_upstream_errors_total", "Errors returned by Bedrock or the OpenAI upstream.",
+                          ("endpoint", "model", "region", "code"))
+upstream_throttles = Counter("swiftchat_upstream_throttles_total",
+                             "Upstream errors that signal throttling or exhausted quota.",
+                             ("endpoint", "model", "region"))
+abandoned_streams = Counter("swiftchat_abandoned_streams_total",
+                            "Streams closed before the end because the client disconnected.",
+                            ("endpoint", "model", "region"))
+abandoned_tokens_saved = Counter("swiftchat_abandoned_tokens_saved_total",
+                                 "Estimated output tokens not generated because abandoned streams were closed, "
+                                 "from the average length and speed of completed streams.",
+                                 ("endpoint", "model", "region"))
+
+# smoothed (output tokens, output tokens per second) of completed streams per label set
+_stream_profiles = {}
+
+
+def get_error_code(error) -> str:
+    response = getattr(error, "response", None)
+    if isinstance(response, dict):
+        return response.get("Error", {}).get("Code") or type(error).__name__
+    status_code = getattr(response, "status_code", None)
+    if status_code is not None:
+        return str(status_code)
+    return type(error).__name__
+
+
+def record_upstream_error(endpoint: str, model: str, region: str, error, code: str | None = None) -> str:
+    code = code or get_error_code(error)
+    upstream_errors.inc(endpoint, model, region, code)
+    if code in THROTTLE_CODES or "Throttling" in str(error):
+        upstream_throttles.inc(endpoint, model, region)
+    return code
+
+
+class StreamObserver:
+    """Record first-event latency, duration, token usage and outcome of one response stream."""
+
+    def __init__(self, endpoint: str, model: str, region: str = ""):
+        self.labels = (endpoint, model, region or "")
+        self.start = time.perf_counter()
+        self.first_event = None
+        self.output_tokens = None
+        self.status = None
+        inflight_streams.inc(endpoint)
+
+    def on_event(self):
+        if self.first_event is None:
+            self.first_event = time.perf_counter()
+            first_event_latency.observe(*self.labels, value=self.first_event - self.start)
+
+    def on_converse_event(self, item: dict):
+        self.on_event()
+        metadata = item.get("metadata")
+        if metadata is not None:
+            usage = metadata.get("usage", {})
+            self.on_usage(usage.get("inputTokens"), usage.get("outputTokens"),
+                          usage.get("cacheReadInputTokens"), usage.get("cacheWriteInputTokens"))
+
+    def on_usage(self, input_tokens: int | None, output_tokens: int | None,
+                 cache_read_tokens: int | None = None, cache_write_tokens: int | None = None):
+        if input_tokens:
+            tokens.inc(*self.labels, "input", amount=input_tokens)
+        if cache_read_tokens:
+            tokens.inc(*self.labels, "cache_read", amount=cache_read_tokens)
+        if cache_write_tokens:
+            tokens.inc(*self.labels, "cache_write", amount=cache_write_tokens)
+        if output_tokens:
+            tokens.inc(*self.labels, "output", amount=output_tokens)
+            self.output_tokens = output_tokens
+
+    def on_error(self, error, code: str | None = None):
+        self.status = "error"
+        record_upstream_error(*self.labels, error, code)
+
+    def finish(self, status: str = "ok"):
+        if self.labels is None:
+            return
+        end = time.perf_counter()
+        stream_duration.observe(*self.labels, value=end - self.start)
+        generating = end - self.first_event if self.first_event is not None else 0
+        status = self.status or status
+        if self.output_tokens and generating > 0:
+            output_tokens_per_second.observe(*self.labels, value=self.output_tokens / generating)
+            if status == "ok":
+                update_stream_profile(self.labels, self.output_tokens, self.output_tokens / generating)
+        if status == "cancelled":
+            abandoned_streams.inc(*self.labels)
+            profile = _stream_profiles.get(self.labels)
+            if profile is not None:
+                abandoned_tokens_saved.inc(*self.labels, amount=max(0.0, profile[0] - profile[1] * generating))
+        model_requests.inc(*self.labels, status)
+        inflight_streams.dec(self.labels[0])
+        self.labels = None
+
+
+def update_stream_profile(labels: tuple, output_tokens: int, rate: float):
+    profile = _stream_profiles.get(labels)
+    if profile is None:
+        if len(_stream_profiles) < METRICS_MAX_SERIES:
+            _stream_profiles[labels] = (output_tokens, rate)
+        return
+    _stream_profiles[labels] = (profile[0] * 0.9 + output_tokens * 0.1, profile[1] * 0.9 + rate * 0.1)
+
+
+async def observe_converse_stream(events, observer: StreamObserver):
+    """Pass converse stream events through, recording them on observer."""
+    status = "ok"
+    try:
+        async for item in events:
+            observer.on_converse_event(item)
+            yield item
+    except (GeneratorExit, asyncio.CancelledError):
+        status = "cancelled"
+        raise
+    except Exception as error:
+        observer.on_error(error)
+        raise
+    finally:
+        observer.finish(status)
+
+
+def collect_threadpool() -> list:
+    from anyio.to_thread import current_default_thread_limiter
+    limiter = current_default_thread_limiter()
+    statistics = limiter.statistics()
+    return [
+        ("swiftchat_threadpool_busy_threads", "gauge", "Worker threads running blocking calls.",
+         [({}, statistics.borrowed_tokens)]),
+        ("swiftchat_threadpool_max_threads", "gauge", "Size of the worker thread pool.",
+         [({}, limiter.total_tokens)]),
+        ("swiftchat_threadpool_waiting_tasks", "gauge", "Blocking calls queued for a free worker thread.",
+         [({}, statistics.tasks_waiting)]),
+    ]
+
+
+add_collector(collect_threadpool)
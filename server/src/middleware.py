@@ -0,0 +1,195 @@
+import time
+import zlib
+
+from fastapi import HTTPException
+from starlette.responses import JSONResponse
+
+from metrics import http_latency, http_requests
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+class BodySizeLimitMiddleware:
+    """Reject request bodies larger than max_body_bytes before they are buffered.
+
+    Requests announcing a larger Content-Length are answered with 413 right away;
+    chunked bodies are counted while they are received.
+    """
+
+    def __init__(self, app, max_body_bytes: int):
+        self.app = app
+        self.max_body_bytes = max_body_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or self.max_body_bytes <= 0:
+            await self.app(scope, receive, send)
+            return
+        for name, value in scope["headers"]:
+            if name == b"content-length" and value.isdigit() and int(value) > self.max_body_bytes:
+                response = JSONResponse({"detail": self.error_detail()}, status_code=413)
+                await response(scope, receive, send)
+                return
+
+        received_bytes = 0
+
+        async def limited_receive():
+            nonlocal received_bytes
+            message = await receive()
+            if message["type"] == "http.request":
+                received_bytes += len(message.get("body", b""))
+                if received_bytes > self.max_body_bytes:
+                    raise HTTPException(status_code=413, detail=self.error_detail())
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+    def error_detail(self) -> str:
+        return f"Error: request body exceeds the {self.max_body_bytes} bytes limit"
+
+
+class BodyTooLarge(Exception):
+    pass
+
+
+class GzipDecoder:
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.size = 0
+        self._zlib = zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+    def decode(self, data: bytes) -> bytes:
+        # ask for one byte past the limit, so a bomb stops there instead of expanding in memory
+        output = self._zlib.decompress(data, self.limit - self.size + 1 if self.limit else 0)
+        self.size += len(output)
+        if self.limit and self.size > self.limit:
+            raise BodyTooLarge()
+        return output
+
+    def finish(self) -> bytes:
+        if not self._zlib.eof:
+            raise zlib.error("truncated gzip stream")
+        return b""
+
+
+class ZstdDecoder:
+    # a zstd RLE block expands 4 input bytes to 128 KB
+    MAX_RATIO = 32768
+    MIN_SLICE = 128
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.size = 0
+        self._zstd = zstandard.ZstdDecompressor().decompressobj()
+
+    def decode(self, data: bytes) -> bytes:
+        # decompress has no output limit, so feed slices small enough that a bomb
+        # cannot expand far beyond the limit before it is caught
+        output = []
+        view = memoryview(data)
+        while view:
+            step = max(self.MIN_SLICE, (self.limit - self.size) // self.MAX_RATIO) if self.limit else len(view)
+            chunk = self._zstd.decompress(view[:step])
+            view = view[step:]
+            self.size += len(chunk)
+            if self.limit and self.size > self.limit:
+                raise BodyTooLarge()
+            output.append(chunk)
+        return b"".join(output)
+
+    def finish(self) -> bytes:
+        if not self._zstd.eof:
+            raise zstandard.ZstdError("truncated zstd stream")
+        return b""
+
+
+def create_decoder(encoding: str, limit: int):
+    if encoding in ("gzip", "x-gzip"):
+        return GzipDecoder(limit)
+    if encoding == "zstd" and zstandard is not None:
+        return ZstdDecoder(limit)
+    return None
+
+
+class RequestDecompressionMiddleware:
+    """Decompress gzip or zstd encoded request bodies while they are received.
+
+    The app sees the plain body without Content-Encoding and Content-Length. Bodies
+    expanding beyond max_body_bytes are answered with 413, corrupt ones with 400 and
+    other encodings with 415. zstd needs the optional zstandard package.
+    """
+
+    def __init__(self, app, max_body_bytes: int):
+        self.app = app
+        self.max_body_bytes = max(0, max_body_bytes)
+
+    async def __call__(self, scope, receive, send):
+        encoding = None
+        if scope["type"] == "http":
+            for name, value in scope["headers"]:
+                if name == b"content-encoding":
+                    encoding = value.decode("latin-1").strip().lower()
+        if encoding is None or encoding == "identity":
+            await self.app(scope, receive, send)
+            return
+        decoder = create_decoder(encoding, self.max_body_bytes)
+        if decoder is None:
+            response = JSONResponse({"detail": f"Error: unsupported Content-Encoding {encoding}"}, status_code=415)
+            await response(scope, receive, send)
+            return
+        scope = {**scope, "headers": [(name, value) for name, value in scope["headers"]
+                                      if name not in (b"content-encoding", b"content-length")]}
+
+        async def decoding_receive():
+            message = await receive()
+            if message["type"] == "http.request":
+                try:
+                    body = decoder.decode(message.get("body", b""))
+                    if not message.get("more_body"):
+                        body += decoder.finish()
+                except BodyTooLarge:
+                    raise HTTPException(status_code=413, detail=f"Error: decompressed request body exceeds the "
+                                                                f"{self.max_body_bytes} bytes limit")
+                except Exception as error:
+                    raise HTTPException(status_code=400, detail=f"Error: invalid {encoding} request body: {error}")
+                message = {**message, "body": body}
+            return message
+
+        await self.app(scope, decoding_receive, send)
+
+
+class MetricsMiddleware:
+    """Count requests and time them until the response headers are sent.
+
+    The path label is the matched route template, or "other" for unknown paths,
+    so scanners cannot create new series.
+    """
+
+    def __init__(self, app, routes: list):
+        self.app = app
+        self.routes = routes
+        self.paths = None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        if self.paths is None:
+            self.paths = {route.path for route in self.routes if hasattr(route, "path")}
+        path = scope["path"] if scope["path"] in self.paths else "other"
+        start = time.perf_counter()
+        status = 500
+
+        async def timed_send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                http_latency.observe(path, value=time.perf_counter() - start)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, timed_send)
+        finally:
+            http_requests.inc(path, scope["method"], status)
@@ -0,0 +1,115 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+
+from starlette.concurrency import run_in_threadpool
+
+from aws_clients import get_client
+
+CATALOG_TTL = float(os.environ.get("MODEL_CATALOG_TTL", "3600"))
+CATALOG_STALE_TTL = float(os.environ.get("MODEL_CATALOG_STALE_TTL", "86400"))
+
+_catalogs = {}
+_refresh_tasks = {}
+
+
+def build_catalog(response: dict, region: str):
+    if not response.get("modelSummaries"):
+        return []
+    model_names = set()
+    text_model = []
+    image_model = []
+    for model in response["modelSummaries"]:
+        need_cross_region = "INFERENCE_PROFILE" in model["inferenceTypesSupported"]
+        if (model["modelLifecycle"]["status"] == "ACTIVE"
+                and ("ON_DEMAND" in model["inferenceTypesSupported"] or need_cross_region)
+                and not model["modelId"].endswith("k")
+                and model["modelName"] not in model_names):
+            if ("TEXT" in model.get("outputModalities", []) and
+                    model.get("responseStreamingSupported")):
+                if need_cross_region:
+                    region_prefix = region.split("-")[0]
+                    if region_prefix == 'ap':
+                        region_prefix = 'apac'
+                    model_id = region_prefix + "." + model["modelId"]
+                else:
+                    model_id = model["modelId"]
+                text_model.append({
+                    "modelId": model_id,
+                    "modelName": model["modelName"]
+                })
+            elif "IMAGE" in model.get("outputModalities", []):
+                image_model.append({
+                    "modelId": model["modelId"],
+                    "modelName": model["modelName"]
+                })
+            model_names.add(model["modelName"])
+    return {"textModel": text_model, "imageModel": image_model}
+
+
+def fetch_catalog(region: str) -> dict:
+    response = get_client("bedrock", region).list_foundation_models()
+    models = build_catalog(response, region)
+    content = json.dumps(models, separators=(',', ':')).encode('utf-8')
+    return {
+        "models": models,
+        "etag": '"' + hashlib.sha256(content).hexdigest()[:32] + '"',
+        "fetched_at": time.monotonic()
+    }
+
+
+def start_refresh(region: str) -> asyncio.Task:
+    """Start fetching the catalog of a region, or return the fetch already in flight."""
+    task = _refresh_tasks.get(region)
+    if task is None:
+        task = asyncio.create_task(run_in_threadpool(fetch_catalog, region))
+        _refresh_tasks[region] = task
+        task.add_done_callback(lambda done: on_refresh_done(region, done))
+    return task
+
+
+async def refresh_catalog(region: str) -> dict:
+    return await asyncio.shield(start_refresh(region))
+
+
+def on_refresh_done(region: str, task: asyncio.Task):
+    _refresh_tasks.pop(region, None)
+    if task.cancelled():
+        return
+    if task.exception() is not None:
+        print(f"bedrock error: refresh model catalog of {region} failed, {task.exception()}")
+        return
+    _catalogs[region] = task.result()
+
+
+async def get_catalog(region: str) -> dict:
+    """Return the cached catalog of a region.
+
+    Within CATALOG_TTL the cached copy is returned as is. After that, for up to
+    CATALOG_STALE_TTL more seconds, it is still returned while a background refresh
+    replaces it. Older or missing catalogs are fetched before returning.
+    """
+    entry = _catalogs.get(region)
+    if entry is not None:
+        age = time.monotonic() - entry["fetched_at"]
+        if age < CATALOG_TTL:
+            return entry
+        if age < CATALOG_TTL + CATALOG_STALE_TTL:
+            start_refresh(region)
+            return entry
+    return await refresh_catalog(region)
+
+
+async def warm_catalogs(regions: list):
+    results = await asyncio.gather(*(refresh_catalog(region) for region in regions), return_exceptions=True)
+    for region, result in zip(regions, results):
+        if isinstance(result, Exception):
+            print(f"bedrock error: warm model catalog of {region} failed, {result}")
+
+
+def get_catalog_stats() -> dict:
+    now = time.monotonic()
+    return {region: {"age": round(now - entry["fetched_at"], 1), "etag": entry["etag"]}
+            for region, entry in _catalogs.items()}
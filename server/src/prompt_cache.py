@@ -0,0 +1,55 @@
+import os
+
+from sessions import message_size
+
+PROMPT_CACHE = os.environ.get("PROMPT_CACHE", "false").lower() == "true"
+# substrings of model ids that accept cachePoint blocks in Converse
+PROMPT_CACHE_MODELS = [model for model in os.environ.get(
+    "PROMPT_CACHE_MODELS",
+    "claude-3-7-sonnet,claude-3-5-haiku,claude-sonnet-4,claude-opus-4,"
+    "nova-micro,nova-lite,nova-pro,nova-premier").split(",") if model]
+# prefixes shorter than this are below the models' minimum cacheable size (about 1024 tokens)
+PROMPT_CACHE_MIN_CHARS = int(os.environ.get("PROMPT_CACHE_MIN_CHARS", "4096"))
+
+CACHE_POINT = {"cachePoint": {"type": "default"}}
+
+
+def supports_prompt_cache(model_id: str) -> bool:
+    return any(model in model_id for model in PROMPT_CACHE_MODELS)
+
+
+def has_cache_points(system: list | None, messages: list) -> bool:
+    # checkpoints the client placed itself are left alone
+    blocks = (system or []) + [content for message in messages for content in message.get("content", [])]
+    return any("cachePoint" in block for block in blocks)
+
+
+def with_cache_point(message: dict) -> dict:
+    return {**message, "content": message["content"] + [CACHE_POINT]}
+
+
+def add_cache_points(model_id: str, system: list | None, messages: list) -> tuple[list | None, list]:
+    """Return system and messages with cachePoint blocks for Bedrock prompt caching.
+
+    Checkpoints go after the system prompt, after the last message, whose prefix
+    the next turn reads back, and after the message that was last in the previous
+    turn, so this turn hits the prefix the previous one wrote. Each is only added
+    once its prefix reaches PROMPT_CACHE_MIN_CHARS. The lists are copied, as the
+    messages may be shared with the session store.
+    """
+    if not PROMPT_CACHE or not supports_prompt_cache(model_id) or has_cache_points(system, messages):
+        return system, messages
+    prefix = 0
+    if system:
+        prefix = sum(len(block.get("text", "")) for block in system)
+        if prefix >= PROMPT_CACHE_MIN_CHARS:
+            system = system + [CACHE_POINT]
+    # the previous turn ended with a user message followed by the assistant reply
+    # and the new user message
+    positions = {len(messages) - 1, len(messages) - 3}
+    messages = list(messages)
+    for index, message in enumerate(messages):
+        prefix += message_size(message)
+        if index in positions and prefix >= PROMPT_CACHE_MIN_CHARS and message.get("content"):
+            messages[index] = with_cache_point(message)
+    return system, messages
@@ -0,0 +1,87 @@
+import json
+import secrets
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+BYTES_KEY = b'"bytes"'
+MIN_SLICE_BYTES = 4096
+
+
+def loads(data: bytes):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def split_base64_fields(body: bytes, marker: str) -> tuple[bytes, list]:
+    """Cut the string values of "bytes" keys out of a JSON body.
+
+    Each value of at least MIN_SLICE_BYTES is replaced by marker followed by its
+    index into the returned list of memoryview slices of body, so the JSON parser
+    never copies the base64 text into a str. The marker is random per body, so a
+    value sent by the client cannot be taken for a placeholder. An unescaped '"bytes"' can only be a key, since
+    quotes inside JSON strings are escaped. Values containing an escape are left
+    in place for the parser.
+    """
+    view = memoryview(body)
+    prefix = marker.encode()
+    parts = []
+    slices = []
+    position = 0
+    search = 0
+    while True:
+        key = body.find(BYTES_KEY, search)
+        if key < 0:
+            break
+        search = key + len(BYTES_KEY)
+        colon = search
+        while colon < len(body) and body[colon] in b' \t\r\n':
+            colon += 1
+        if colon >= len(body) or body[colon] != ord(':'):
+            continue
+        start = colon + 1
+        while start < len(body) and body[start] in b' \t\r\n':
+            start += 1
+        if start >= len(body) or body[start] != ord('"'):
+            continue
+        end = body.find(b'"', start + 1)
+        if end < 0:
+            break
+        if end - start - 1 < MIN_SLICE_BYTES or body.find(b'\\', start + 1, end) >= 0:
+            search = end + 1
+            continue
+        parts.append(view[position:start + 1])
+        parts.append(prefix + str(len(slices)).encode())
+        slices.append(view[start + 1:end])
+        position = end
+        search = end + 1
+    if not slices:
+        return body, slices
+    parts.append(view[position:])
+    return b''.join(parts), slices
+
+
+def restore_base64_fields(value, slices: list, marker: str):
+    """Put the slices cut by split_base64_fields back where their placeholders are."""
+    if isinstance(value, dict):
+        for key, item in value.items():
+            if key == 'bytes' and type(item) is str and item.startswith(marker):
+                value[key] = slices[int(item[len(marker):])]
+            elif isinstance(item, (dict, list)):
+                restore_base64_fields(item, slices, marker)
+    elif isinstance(value, list):
+        for item in value:
+            if isinstance(item, (dict, list)):
+                restore_base64_fields(item, slices, marker)
+    return value
+
+
+def parse_json_body(body: bytes):
+    """Parse a JSON request body, leaving large base64 "bytes" values as memoryview slices."""
+    marker = f"slice-{secrets.token_hex(16)}-"
+    stripped, slices = split_base64_fields(body, marker)
+    data = loads(stripped)
+    return restore_base64_fields(data, slices, marker) if slices else data
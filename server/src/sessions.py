@@ -0,0 +1,144 @@
+import hashlib
+import json
+import os
+
+from fastapi import HTTPException
+from starlette.concurrency import run_in_threadpool
+
+from attachments import ATTACHMENT_TYPES, INLINE_DECODE_BYTES
+from cache import LRUCache
+
+SESSION_ID_MAX_LENGTH = 128
+# rough per-message and per-block overhead of the dicts themselves
+MESSAGE_OVERHEAD = 200
+CONTENT_OVERHEAD = 100
+
+
+class Session:
+    """A conversation history with the cumulative size and the digest of each prefix,
+    so truncating it to any length doesn't have to walk the messages again."""
+
+    __slots__ = ("messages", "offsets", "digests")
+
+    def __init__(self, messages: list, offsets: list, digests: list):
+        self.messages = messages
+        self.offsets = offsets
+        self.digests = digests
+
+    @property
+    def size(self) -> int:
+        return self.offsets[-1]
+
+
+class MemorySessionStore:
+    """In-process session store, an LRU bounded by total history size and count.
+
+    Another backend only needs the same get/put/pop/stats methods to replace
+    session_store.
+    """
+
+    def __init__(self, max_bytes: int, max_entries: int, ttl: float):
+        self._cache = LRUCache(max_bytes=max_bytes, max_entries=max_entries, ttl=ttl,
+                               size_of=lambda session: session.size)
+
+    def get(self, session_id: str) -> Session | None:
+        return self._cache.get(session_id)
+
+    def put(self, session_id: str, session: Session):
+        self._cache.put(session_id, session)
+
+    def pop(self, session_id: str):
+        self._cache.pop(session_id)
+
+    def stats(self) -> dict:
+        return self._cache.stats()
+
+
+session_store = MemorySessionStore(
+    max_bytes=int(os.environ.get("SESSION_STORE_MAX_BYTES", str(256 * 1024 * 1024))),
+    max_entries=int(os.environ.get("SESSION_STORE_MAX_ENTRIES", "10000")),
+    ttl=float(os.environ.get("SESSION_TTL", "3600"))
+)
+
+
+def message_size(message: dict) -> int:
+    size = MESSAGE_OVERHEAD
+    for content in message.get("content", []):
+        size += CONTENT_OVERHEAD
+        if "text" in content:
+            size += len(content["text"])
+        for attachment_type in ATTACHMENT_TYPES:
+            if attachment_type in content:
+                size += len(content[attachment_type]["source"].get("bytes") or b"")
+    return size
+
+
+def hash_binary(value) -> str:
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return hashlib.sha256(value).hexdigest()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def get_message_digests(previous: str, messages: list) -> list:
+    """Chain a sha256 over messages: each digest covers its message and all before it.
+
+    Decoded attachments are hashed by content, so the same history gives the same
+    digests in every worker.
+    """
+    digests = []
+    for message in messages:
+        digest = hashlib.sha256(previous.encode())
+        digest.update(json.dumps(message, sort_keys=True, default=hash_binary).encode())
+        previous = digest.hexdigest()
+        digests.append(previous)
+    return digests
+
+
+def get_session_base(session_id: str, base_length: int, base_digest: str | None = None) -> Session | None:
+    """Return the stored session a delta request builds on, or None to start a new one.
+
+    A session that expired, was evicted, holds fewer than base_length messages or
+    whose first base_length messages don't match base_digest, e.g. because another
+    worker stored an edited history meanwhile, is answered with 409, and the client
+    resends the whole history.
+    """
+    if len(session_id) > SESSION_ID_MAX_LENGTH:
+        raise HTTPException(status_code=400, detail="Error: sessionId is too long")
+    if base_length <= 0:
+        return None
+    session = session_store.get(session_id)
+    if (session is None or len(session.messages) < base_length
+            or (base_digest is not None and session.digests[base_length] != base_digest)):
+        raise HTTPException(status_code=409, detail={
+            "error": "Error: session not found, please resend the full messages",
+            "sessionExpired": True
+        })
+    return session
+
+
+async def append_session(session_id: str, base: Session | None, base_length: int, messages: list) -> Session:
+    """Store base's first base_length messages plus the new, already decoded messages
+    under session_id and return the stored session.
+
+    The stored lists are never modified in place, so a stream still sending an
+    older history is unaffected. Large attachments are hashed on the threadpool.
+    """
+    if base is None:
+        history, offsets, digests = [], [0], [""]
+    else:
+        history, offsets, digests = (base.messages[:base_length], base.offsets[:base_length + 1],
+                                     base.digests[:base_length + 1])
+    history = history + messages
+    for message in messages:
+        offsets.append(offsets[-1] + message_size(message))
+    if offsets[-1] - offsets[len(history) - len(messages)] > INLINE_DECODE_BYTES:
+        digests += await run_in_threadpool(get_message_digests, digests[-1], messages)
+    else:
+        digests += get_message_digests(digests[-1], messages)
+    session = Session(history, offsets, digests)
+    session_store.put(session_id, session)
+    return session
+
+
+def get_session_stats() -> dict:
+    return session_store.stats()
@@ -0,0 +1,124 @@
+import asyncio
+import json
+import os
+
+SSE_COALESCE_WINDOW = float(os.environ.get("SSE_COALESCE_WINDOW_MS", "15")) / 1000
+SSE_COALESCE_MAX_BYTES = int(os.environ.get("SSE_COALESCE_MAX_BYTES", "16384"))
+
+
+class SSEFramer:
+    """Incrementally split a server-sent events byte stream into complete events.
+
+    Each returned event keeps its original bytes, including the blank-line separator,
+    so re-joining the events reproduces the stream exactly.
+    """
+
+    def __init__(self):
+        self.usage = None
+        self._buffer = bytearray()
+
+    def feed(self, data: bytes) -> list:
+        self._buffer += data
+        events = []
+        start = 0
+        while True:
+            lf = self._buffer.find(b'\n\n', start)
+            crlf = self._buffer.find(b'\r\n\r\n', start)
+            if lf < 0 and crlf < 0:
+                break
+            if crlf >= 0 and (lf < 0 or crlf < lf):
+                end = crlf + 4
+            else:
+                end = lf + 2
+            event = bytes(self._buffer[start:end])
+            self.parse_usage(event)
+            events.append(event)
+            start = end
+        if start:
+            del self._buffer[:start]
+        return events
+
+    def flush(self) -> bytes:
+        rest = bytes(self._buffer)
+        self._buffer.clear()
+        return rest
+
+    def parse_usage(self, event: bytes):
+        if b'"usage"' not in event:
+            return
+        for line in event.splitlines():
+            if line.startswith(b'data:'):
+                try:
+                    usage = json.loads(line[5:]).get('usage')
+                except (ValueError, AttributeError):
+                    continue
+                if usage:
+                    self.usage = usage
+
+
+async def window_batches(items, window: float, max_size: int, size_of=len):
+    """Group an async iterator's items into lists, one list per `window` seconds.
+
+    A batch opens with its first item and is yielded once `window` has passed or
+    its size reaches `max_size`. Waiting never cancels the upstream read, so no
+    item is lost when a batch closes.
+    """
+    loop = asyncio.get_running_loop()
+    iterator = items.__aiter__()
+    pending = None
+    batch = []
+    batch_size = 0
+    batch_started = 0.0
+    try:
+        while True:
+            if pending is None:
+                pending = asyncio.ensure_future(iterator.__anext__())
+            timeout = max(0.0, batch_started + window - loop.time()) if batch else None
+            done, _ = await asyncio.wait({pending}, timeout=timeout)
+            if not done:
+                yield batch
+                batch = []
+                batch_size = 0
+                continue
+            try:
+                item = pending.result()
+            except StopAsyncIteration:
+                pending = None
+                break
+            except Exception:
+                pending = None
+                if batch:
+                    yield batch
+                raise
+            pending = None
+            if not batch:
+                batch_started = loop.time()
+            batch.append(item)
+            batch_size += size_of(item)
+            if batch_size >= max_size:
+                yield batch
+                batch = []
+                batch_size = 0
+        if batch:
+            yield batch
+    finally:
+        if pending is not None:
+            pending.cancel()
+
+
+async def coalesce_sse(chunks, framer: SSEFramer, window: float | None = None, max_bytes: int | None = None):
+    """Re-frame an SSE byte stream on event boundaries and merge events into fewer writes.
+
+    Upstream reads are collected for at most `window` seconds or `max_bytes`, and
+    only the complete events among them are written, together; a partial event
+    waits for the rest of its bytes.
+    """
+    window = SSE_COALESCE_WINDOW if window is None else window
+    max_bytes = SSE_COALESCE_MAX_BYTES if max_bytes is None else max_bytes
+    async for batch in window_batches(chunks, window, max_bytes):
+        events = framer.feed(b''.join(batch))
+        if events:
+            yield b''.join(events)
+    rest = framer.flush()
+    if rest:
+        yield rest
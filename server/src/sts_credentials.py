@@ -0,0 +1,84 @@
+import asyncio
+import os
+import time
+from datetime import datetime, timezone
+
+from starlette.concurrency import run_in_threadpool
+
+from aws_clients import get_client
+from metrics import Histogram
+
+SESSION_DURATION = int(os.environ.get("STS_SESSION_DURATION", "3600"))
+REFRESH_BEFORE_EXPIRATION = float(os.environ.get("STS_REFRESH_BEFORE_SECONDS", "900"))
+MIN_REMAINING = 60
+
+_credentials = {}
+_refresh_tasks = {}
+_stats = {
+    "requests": 0,
+    "hits": 0,
+    "refreshes": 0,
+    "failures": 0
+}
+refresh_latency = Histogram("swiftchat_sts_refresh_seconds", "Latency of assume_role refreshes for /api/token.",
+                            ("region",))
+
+
+def assume_client_role(region: str, role_arn: str) -> dict:
+    start = time.perf_counter()
+    try:
+        response = get_client('sts', region).assume_role(
+            RoleArn=role_arn,
+            RoleSessionName=f"SwiftChatClient-{int(time.time())}",
+            DurationSeconds=SESSION_DURATION
+        )
+    finally:
+        refresh_latency.observe(region, value=time.perf_counter() - start)
+    return response['Credentials']
+
+
+def start_refresh(region: str, role_arn: str) -> asyncio.Task:
+    task = _refresh_tasks.get(region)
+    if task is None:
+        task = asyncio.create_task(run_in_threadpool(assume_client_role, region, role_arn))
+        _refresh_tasks[region] = task
+        task.add_done_callback(lambda done: on_refresh_done(region, done))
+    return task
+
+
+def on_refresh_done(region: str, task: asyncio.Task):
+    _refresh_tasks.pop(region, None)
+    if task.cancelled() or task.exception() is not None:
+        _stats["failures"] += 1
+        return
+    _stats["refreshes"] += 1
+    _credentials[region] = task.result()
+
+
+def get_remaining_seconds(credentials: dict) -> float:
+    return (credentials['Expiration'] - datetime.now(timezone.utc)).total_seconds()
+
+
+async def get_client_credentials(region: str, role_arn: str) -> dict:
+    """Return temporary credentials of the client role, shared by every caller in a region.
+
+    Cached credentials are handed out until REFRESH_BEFORE_EXPIRATION seconds before
+    they expire. Then one assume_role call replaces them and concurrent callers
+    wait for it; if it fails while the old credentials are still usable, those
+    are returned instead.
+    """
+    _stats["requests"] += 1
+    credentials = _credentials.get(region)
+    if credentials is not None and get_remaining_seconds(credentials) > REFRESH_BEFORE_EXPIRATION:
+        _stats["hits"] += 1
+        return credentials
+    try:
+        return await asyncio.shield(start_refresh(region, role_arn))
+    except Exception:
+        if credentials is not None and get_remaining_seconds(credentials) > MIN_REMAINING:
+            return credentials
+        raise
+
+
+def get_sts_stats() -> dict:
+    return dict(_stats)
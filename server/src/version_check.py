@@ -0,0 +1,68 @@
+import asyncio
+import time
+
+from http_clients import get_http_client
+
+CACHE_DURATION = 120000
+MAX_FAILURE_BACKOFF = 1800000
+TAGS_URL = "https://api.github.com/repos/aws-samples/swift-chat/tags"
+
+cache = {
+    "latest_version": "",
+    "last_check": 0,
+    "failures": 0,
+    "retry_at": 0
+}
+_refresh_task = None
+
+
+async def fetch_latest_version() -> str:
+    response = await get_http_client(TAGS_URL).get(TAGS_URL, headers={'User-Agent': 'Mozilla/5.0'}, timeout=10)
+    response.raise_for_status()
+    return response.json()[0]['name']
+
+
+def start_refresh() -> asyncio.Task:
+    global _refresh_task
+    if _refresh_task is None:
+        _refresh_task = asyncio.create_task(fetch_latest_version())
+        _refresh_task.add_done_callback(on_refresh_done)
+    return _refresh_task
+
+
+def on_refresh_done(task: asyncio.Task):
+    global _refresh_task
+    _refresh_task = None
+    timestamp = int(time.time() * 1000)
+    if not task.cancelled() and task.exception() is None:
+        cache["latest_version"] = task.result()
+        cache["last_check"] = timestamp
+        cache["failures"] = 0
+        cache["retry_at"] = 0
+        return
+    cache["failures"] += 1
+    cache["retry_at"] = timestamp + min(CACHE_DURATION * 2 ** (cache["failures"] - 1), MAX_FAILURE_BACKOFF)
+    if not task.cancelled():
+        print(f"Error occurred when get github tag: {task.exception()}")
+
+
+async def get_latest_version() -> str:
+    """Return the latest release tag, refreshing it at most once per CACHE_DURATION.
+
+    All callers share one in-flight GitHub request. Once a version is known it is
+    returned immediately and refreshed in the background; after failures the last
+    known version keeps being served and retries back off exponentially.
+    """
+    timestamp = int(time.time() * 1000)
+    expired = timestamp - cache["last_check"] >= CACHE_DURATION
+    can_retry = timestamp >= cache["retry_at"]
+    if cache["latest_version"]:
+        if expired and can_retry:
+            start_refresh()
+        return cache["latest_version"]
+    if not can_retry:
+        return '0.0.0'
+    try:
+        return await asyncio.shield(start_refresh())
+    except Exception:
+        return '0.0.0'